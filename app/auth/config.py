@@ -0,0 +1,27 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# signed-in users are served from memory for this long; profile updates, logout and
+# account deletion drop the entry right away in this process
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+# how often every process pulls new entries of the revocation list (logouts made elsewhere)
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", 15))
+
+# bcrypt cost factor for new hashes (each +1 doubles the ~250 ms of CPU at the default 12)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# hashing runs on its own small pool so a login burst cannot take the threads classification needs
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", 32))
+
+# token buckets for /signin and /signup: `capacity` attempts at once, refilled at `rate` per second
+AUTH_RATE_LIMIT_ENABLED = os.getenv("AUTH_RATE_LIMIT_ENABLED", "true").lower() == "true"
+AUTH_IP_RATE_CAPACITY = int(os.getenv("AUTH_IP_RATE_CAPACITY", 20))
+AUTH_IP_RATE_PER_SECOND = float(os.getenv("AUTH_IP_RATE_PER_SECOND", 0.5))
+AUTH_ACCOUNT_RATE_CAPACITY = int(os.getenv("AUTH_ACCOUNT_RATE_CAPACITY", 5))
+AUTH_ACCOUNT_RATE_PER_SECOND = float(os.getenv("AUTH_ACCOUNT_RATE_PER_SECOND", 0.1))
+AUTH_RATE_LIMIT_MAX_KEYS = int(os.getenv("AUTH_RATE_LIMIT_MAX_KEYS", 100000))
+# use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+AUTH_TRUST_FORWARDED_FOR = os.getenv("AUTH_TRUST_FORWARDED_FOR", "false").lower() == "true"
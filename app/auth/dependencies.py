@@ -1,42 +1,69 @@
 
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app.auth.service import decode_access_token
-from app.db.mongo import get_mongo_db
-from pymongo.database import Database
-from app.utils.exceptions import user_not_found_exception, invalid_token_exception
-from app.utils.getters_services import get_user_by_id
+from app.auth.config import (
+    AUTH_ACCOUNT_RATE_CAPACITY,
+    AUTH_ACCOUNT_RATE_PER_SECOND,
+    AUTH_IP_RATE_CAPACITY,
+    AUTH_IP_RATE_PER_SECOND,
+    AUTH_RATE_LIMIT_ENABLED,
+    AUTH_RATE_LIMIT_MAX_KEYS,
+    AUTH_TRUST_FORWARDED_FOR
+)
+from app.auth.service import authenticate
+from app.db.mongo import get_async_db
+from pymongo.asynchronous.database import AsyncDatabase
+from app.utils.exceptions import invalid_token_exception, too_many_requests_exception
+from app.utils.rate_limit import MemoryRateLimiter
 
 security_opt = HTTPBearer(auto_error=False)
 security = HTTPBearer()
 
-async def get_current_user_optional(cred: HTTPAuthorizationCredentials = Depends(security_opt), db: Database = Depends(get_mongo_db)):
+ip_rate_limiter = MemoryRateLimiter(AUTH_IP_RATE_CAPACITY, AUTH_IP_RATE_PER_SECOND, AUTH_RATE_LIMIT_MAX_KEYS)
+account_rate_limiter = MemoryRateLimiter(AUTH_ACCOUNT_RATE_CAPACITY, AUTH_ACCOUNT_RATE_PER_SECOND, AUTH_RATE_LIMIT_MAX_KEYS)
+
+
+def client_ip(request: Request) -> str:
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if AUTH_TRUST_FORWARDED_FOR and forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def rate_limit_by_ip(request: Request):
+    # runs before any password hashing, so a flood costs a dict lookup, not bcrypt
+    if not AUTH_RATE_LIMIT_ENABLED:
+        return
+    retry_after = ip_rate_limiter.hit(client_ip(request))
+    if retry_after:
+        raise too_many_requests_exception(retry_after)
+
+
+def rate_limit_by_account(email: str):
+    if not AUTH_RATE_LIMIT_ENABLED:
+        return
+    retry_after = account_rate_limiter.hit(email.lower())
+    if retry_after:
+        raise too_many_requests_exception(retry_after)
+
+
+async def get_current_user_optional(cred: HTTPAuthorizationCredentials = Depends(security_opt), db: AsyncDatabase = Depends(get_async_db)):
     token = cred.credentials if cred else None # remove if cred else None if not optional
     if not token:
         return None
-    
+
     try:
-        decoded_token = decode_access_token(token)
-        user_id = decoded_token.get("sub")
-        user = get_user_by_id(db, user_id)
-        if not user:
-            raise user_not_found_exception
-        return user
+        return await authenticate(db, token)
     except Exception:
         raise invalid_token_exception
-    
 
-async def get_current_user(cred: HTTPAuthorizationCredentials = Depends(security), db: Database = Depends(get_mongo_db)):
+
+async def get_current_user(cred: HTTPAuthorizationCredentials = Depends(security), db: AsyncDatabase = Depends(get_async_db)):
     token = cred.credentials
     if not token:
         raise invalid_token_exception
     try:
-        decoded_token = decode_access_token(token)
-        user_id = decoded_token.get("sub")
-        user = get_user_by_id(db, user_id)
-        if not user:
-            raise user_not_found_exception
-        return user
+        return await authenticate(db, token)
     except Exception:
-        raise invalid_token_exception
\ No newline at end of file
+        raise invalid_token_exception
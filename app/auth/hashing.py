@@ -1,6 +1,18 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.context import CryptContext
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.auth.config import BCRYPT_ROUNDS, PASSWORD_HASH_QUEUE_LIMIT, PASSWORD_HASH_WORKERS
+from app.utils.exceptions import service_overloaded_exception
+
+bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL, so a couple of threads use real cores without touching
+# the worker pool or the default threadpool the rest of the app runs on
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending = 0
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -9,3 +21,25 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def hash_password(password: str) -> str:
     return bcrypt_context.hash(password)
+
+
+async def run_hashing(fn, *args):
+    global _pending
+    # past the queue limit a request would only wait for a slot longer than it is worth
+    if _pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT:
+        raise service_overloaded_exception
+
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(hash_executor, functools.partial(fn, *args))
+    finally:
+        _pending -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_hashing(verify_password, plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    return await run_hashing(hash_password, password)
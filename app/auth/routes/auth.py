@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends
-from app.auth.hashing import hash_password, verify_password
+from app.auth.hashing import hash_password_async, verify_password_async
 from app.auth.models import User
 from app.auth.schemas import UserCreate, UserLogin, UserResponse, UserLoginResponse
-from app.auth.dependencies import get_current_user
-from app.auth.service import update_user_tokens
-from app.db.mongo import get_mongo_db
-from bson import ObjectId
+from app.auth.dependencies import account_rate_limiter, get_current_user, rate_limit_by_account, rate_limit_by_ip
+from app.auth.service import invalidate_user, revocation_list
+from app.db.mongo import get_async_db
+from app.db.repositories import UserRepository
+from pymongo.asynchronous.database import AsyncDatabase
 
 from app.utils.getters_services import get_user_by_email, get_user_by_id 
 from app.utils.exceptions import ( 
@@ -15,15 +16,13 @@ from app.utils.exceptions import (
     invalid_token_exception,
     user_not_found_exception
 )
-from app.utils.jwt_handlers import create_access_token, create_refresh_token
+from app.utils.jwt_handlers import create_access_token, create_refresh_token, new_session_id
 
 auth_router = APIRouter()
 
-@auth_router.post("/signup", response_model=UserResponse)
-def register_user(user: UserCreate):
-    db = get_mongo_db()
-    
-    existing_user = get_user_by_email(db, user.email)
+@auth_router.post("/signup", response_model=UserResponse, dependencies=[Depends(rate_limit_by_ip)])
+async def register_user(user: UserCreate, db: AsyncDatabase = Depends(get_async_db)):
+    existing_user = await get_user_by_email(db, user.email)
     if existing_user:
         raise email_already_registered_exception
 
@@ -33,37 +32,37 @@ def register_user(user: UserCreate):
         username=user.username,
         email=user.email,
         date_of_birth=user.date_of_birth,
-        password=hash_password(user.password)
+        password=await hash_password_async(user.password)
     )
 
     db_user = user_data.to_dict()
-    result = db.users.insert_one(db_user)
+    inserted_id = await UserRepository(db).create(db_user)
 
     user_data_dict = user_data.to_dict()
-    user_data_dict["id"] = str(result.inserted_id)
+    user_data_dict["id"] = inserted_id
     del user_data_dict["password"]
 
     return user_data_dict
 
 
-@auth_router.post("/signin", response_model=UserLoginResponse)
-def sign_in(user: UserLogin):
-    db = get_mongo_db()
-
-    existing_user = get_user_by_email(db, user.email)
+@auth_router.post("/signin", response_model=UserLoginResponse, dependencies=[Depends(rate_limit_by_ip)])
+async def sign_in(user: UserLogin, db: AsyncDatabase = Depends(get_async_db)):
+    rate_limit_by_account(user.email)
+    existing_user = await get_user_by_email(db, user.email)
     if not existing_user:
         raise email_not_registered_exception
     
-    if not verify_password(user.password, existing_user["password"]):
+    if not await verify_password_async(user.password, existing_user["password"]):
         raise invalid_credentials_exception
+    account_rate_limiter.reset(user.email.lower())
 
 
     user_id = str(existing_user["_id"])
 
-    access_token = create_access_token(data={"sub": user_id})
-    refresh_token = create_refresh_token(data={"sub": user_id})
-    user_id = str(existing_user["_id"])
-    update_user_tokens(db, user_id, access_token, refresh_token)
+    # stateless: both tokens share a session id, logout revokes the session
+    session_id = new_session_id()
+    access_token = create_access_token(data={"sub": user_id, "sid": session_id})
+    refresh_token = create_refresh_token(data={"sub": user_id, "sid": session_id})
 
     return UserLoginResponse(
         first_name=existing_user["first_name"],
@@ -79,13 +78,11 @@ def sign_in(user: UserLogin):
 @auth_router.patch("/logout")
 async def logout(
     current_user: dict = Depends(get_current_user),
-    db = Depends(get_mongo_db)
+    db: AsyncDatabase = Depends(get_async_db)
 ):
     try:
-        db.users.update_one(
-            {"_id": ObjectId(current_user["_id"])},
-            {"$set": {"access_token": None, "refresh_token": None}}
-        )
+        await revocation_list.revoke(db, current_user["session_id"])
+        invalidate_user(current_user["_id"])
         return {"message": "User logged out successfully"}
     except Exception as e:
         raise invalid_token_exception
@@ -1,15 +1,16 @@
 from fastapi import APIRouter, Depends
 from app.auth.schemas import UserResponse, UserBase, UserUpdate
 from app.auth.dependencies import get_current_user
-from app.db.mongo import get_mongo_db
-from pymongo.database import Database
+from app.auth.service import invalidate_user, revocation_list
+from app.db.mongo import get_async_db
+from app.db.repositories import UserRepository
+from pymongo.asynchronous.database import AsyncDatabase
 from app.utils.exceptions import ( 
     user_not_found_exception,
     no_data_to_update_exception,
     no_changes_made_exception
 )
 from app.utils.getters_services import get_user_by_id
-from bson import ObjectId
 from datetime import datetime, timezone, time, date
 import dateutil.parser
 
@@ -31,7 +32,7 @@ def get_profile(user: UserResponse = Depends(get_current_user)):
 async def update_user(
     update_data: UserUpdate,
     user: UserResponse = Depends(get_current_user),
-    db: Database = Depends(get_mongo_db)
+    db: AsyncDatabase = Depends(get_async_db)
 ):
     print(update_data)
     update_values = update_data.dict(exclude_unset=True, exclude_none=True)
@@ -54,15 +55,13 @@ async def update_user(
     
     update_values["updated_at"] = datetime.now(timezone.utc)
     
-    result = db.users.update_one(
-        {"_id": ObjectId(user["_id"])},
-        {"$set": update_values}
-    )
+    modified_count = await UserRepository(db).update(user["_id"], update_values)
+    invalidate_user(user["_id"])
 
-    if result.modified_count == 0:
+    if modified_count == 0:
         raise no_changes_made_exception
 
-    updated_user = get_user_by_id(db, user["_id"])
+    updated_user = await get_user_by_id(db, user["_id"])
     return UserBase(
         first_name=updated_user["first_name"],
         last_name=updated_user["last_name"],
@@ -72,11 +71,13 @@ async def update_user(
     )
 
 @user_router.delete("/")
-def delete_user(
+async def delete_user(
     user: UserResponse = Depends(get_current_user),
-    db: Database = Depends(get_mongo_db)
+    db: AsyncDatabase = Depends(get_async_db)
 ):
-    result = db.users.delete_one({"_id": ObjectId(user["_id"])})
-    if result.deleted_count == 0:
+    deleted_count = await UserRepository(db).delete(user["_id"])
+    invalidate_user(user["_id"])
+    await revocation_list.revoke(db, user["session_id"])
+    if deleted_count == 0:
         raise user_not_found_exception
     return {"message": "User deleted"}
@@ -1,10 +1,11 @@
-from datetime import datetime, timezone
-from bson import ObjectId
-from fastapi import Depends
-from app.db.mongo import get_mongo_db
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from app.auth.config import REVOCATION_SYNC_SECONDS, USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS
+from app.db.repositories import RevokedSessionRepository
 from app.utils.getters_services import get_user_by_id
-from app.utils.jwt_handlers import decode_access_token
-from pymongo.database import Database
+from app.utils.jwt_handlers import decode_access_token, session_expires_at
+from app.utils.result_cache import MemoryCache
 from typing import Optional
 
 from app.utils.exceptions import ( 
@@ -12,25 +13,84 @@ from app.utils.exceptions import (
     user_not_found_exception
 )
 
-def update_user_tokens(db, user_id: str, access_token: str, refresh_token: str):
-    db.users.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {
-            "access_token": access_token,
-            "refresh_token": refresh_token,
-            "updated_at": datetime.now(timezone.utc)
-        }}
-    )
+# user documents by id, without the password hash
+user_cache = MemoryCache(
+    max_entries=USER_CACHE_MAX_ENTRIES,
+    max_bytes=USER_CACHE_MAX_ENTRIES * 1024,
+    ttl_seconds=USER_CACHE_TTL_SECONDS
+)
+
+
+# Logged-out sessions until their last token expires. Lookups are in memory; new entries
+# from other processes are pulled every REVOCATION_SYNC_SECONDS with one indexed query.
+class RevocationList:
+    def __init__(self, sync_interval: float = REVOCATION_SYNC_SECONDS):
+        self.sync_interval = sync_interval
+        self._sessions = {}  # sid -> expiry timestamp
+        self._synced_at = None  # wall clock of the last sync, used as the query cursor
+        self._next_sync = 0.0
+        self._lock = asyncio.Lock()
+
+    def is_revoked(self, session_id: str) -> bool:
+        expires = self._sessions.get(session_id)
+        return expires is not None and expires > time.time()
+
+    async def revoke(self, db, session_id: str):
+        expires_at = session_expires_at()
+        await RevokedSessionRepository(db).revoke(session_id, expires_at, datetime.now(timezone.utc))
+        self._sessions[session_id] = expires_at.timestamp()
+
+    async def sync(self, db, force: bool = False):
+        if not force and (time.monotonic() < self._next_sync or self._lock.locked()):
+            return
+        async with self._lock:
+            started = datetime.now(timezone.utc)
+            since = None
+            if self._synced_at:
+                # overlap with the previous sync so clock skew between writers loses nothing
+                since = self._synced_at - timedelta(seconds=self.sync_interval)
+            docs = await RevokedSessionRepository(db).find_since(since)
+            now = time.time()
+            for doc in docs:
+                self._sessions[doc["_id"]] = doc["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+            self._sessions = {sid: expires for sid, expires in self._sessions.items() if expires > now}
+            self._synced_at = started
+            self._next_sync = time.monotonic() + self.sync_interval
+
+
+revocation_list = RevocationList()
 
 
-def get_current_user(token: dict = Depends(decode_access_token), db: Database = Depends(get_mongo_db)):
-    if not token:
+async def get_cached_user(db, user_id: str) -> Optional[dict]:
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await get_user_by_id(db, user_id)
+        if user is None:
+            return None
+        user = {key: value for key, value in user.items() if key != "password"}
+        user_cache.set(user_id, user)
+    return user
+
+
+def invalidate_user(user_id):
+    user_cache.delete(str(user_id))
+
+
+async def authenticate(db, token: str) -> dict:
+    # signature, expiry, type and revocation are checked in memory; Mongo is only asked
+    # for users missing from the cache
+    payload = decode_access_token(token)
+    if not payload or payload.get("type") != "access" or not payload.get("sid") or not payload.get("sub"):
         raise invalid_token_exception
-    user_id = token.get("sub")
-    user = get_user_by_id(db, user_id)
+
+    await revocation_list.sync(db)
+    if revocation_list.is_revoked(payload["sid"]):
+        raise invalid_token_exception
+
+    user = await get_cached_user(db, payload["sub"])
     if not user:
         raise user_not_found_exception
-    return user 
+    return {**user, "session_id": payload["sid"]}
 
 
 # def get_current_user_optional(
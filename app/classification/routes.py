@@ -1,14 +1,18 @@
-from fastapi import APIRouter, UploadFile, File, Depends
+from fastapi import APIRouter, UploadFile, File, Depends, BackgroundTasks, Query, Response, status
 from app.classification.service import classify_image
-from app.classification.schemas import ClassificationHistoryResponse, ClassificationWithHistoryResponse, ClassificationDetailedHistoryResponse
-from app.db.mongo import get_mongo_db
+from app.classification.schemas import ClassificationHistoryListItem, ClassificationWithHistoryResponse, ClassificationDetailedHistoryResponse
+from app.db.mongo import get_async_db
+from app.db.repositories import ExplanationRepository, HistoryRepository
 from app.auth.dependencies import get_current_user, get_current_user_optional
-from pymongo.database import Database
+from pymongo.asynchronous.database import AsyncDatabase
 from typing import Optional, List
 from bson import ObjectId
-from app.utils.getters_services import get_histories_by_user_id
-from app.utils.exceptions import user_history_not_found_exception, invalid_history_id_exception
-from app.utils.history_cleanup import delete_history_with_related
+from app.utils.getters_services import HISTORY_FIELDS, get_histories_by_user_id
+from app.utils.pagination import decode_cursor, encode_cursor
+from datetime import datetime, timezone
+from app.utils.exceptions import user_history_not_found_exception, invalid_history_id_exception, invalid_history_fields_exception
+from app.utils.history_cleanup import delete_history_with_related, delete_histories_with_related
+from app.utils.config import HISTORY_DELETE_BACKGROUND_THRESHOLD, HISTORY_PAGE_DEFAULT_LIMIT, HISTORY_PAGE_MAX_LIMIT
 
 classify_router = APIRouter()
 
@@ -16,26 +20,60 @@ classify_router = APIRouter()
 @classify_router.post("/", response_model=ClassificationWithHistoryResponse)
 async def skin_classification(
     file: UploadFile = File(...),
-    db: Database = Depends(get_mongo_db),
+    db: AsyncDatabase = Depends(get_async_db),
     user: Optional[dict] = Depends(get_current_user_optional)
 ):
     return await classify_image(file, db=db, user=user)
 
 
-@classify_router.get("/histories", response_model=List[ClassificationHistoryResponse])
+def to_utc_isoformat(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+@classify_router.get("/histories", response_model=List[ClassificationHistoryListItem], response_model_exclude_unset=True)
 async def get_user_history(
-    db: Database = Depends(get_mongo_db),
+    response: Response,
+    limit: int = Query(HISTORY_PAGE_DEFAULT_LIMIT, ge=1, le=HISTORY_PAGE_MAX_LIMIT),
+    after: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of fields to return"),
+    predicted_class: Optional[List[str]] = Query(None),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: AsyncDatabase = Depends(get_async_db),
     user: dict = Depends(get_current_user)
 ):
-    histories  = get_histories_by_user_id(db, user["_id"])
+    selected_fields = None
+    if fields:
+        selected_fields = [field.strip() for field in fields.split(",") if field.strip()]
+        if any(field not in HISTORY_FIELDS for field in selected_fields):
+            raise invalid_history_fields_exception
+
+    histories = await get_histories_by_user_id(
+        db, user["_id"],
+        limit=limit + 1,
+        after=decode_cursor(after) if after else None,
+        ascending=order == "asc",
+        fields=selected_fields,
+        predicted_classes=predicted_class,
+        date_from=to_utc_isoformat(date_from),
+        date_to=to_utc_isoformat(date_to)
+    )
+
+    if len(histories) > limit:
+        histories = histories[:limit]
+        last = histories[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last["timestamp"], last["_id"])
+
+    returned_fields = selected_fields or HISTORY_FIELDS
     return [
-        ClassificationHistoryResponse(
+        ClassificationHistoryListItem(
             id=str(item["_id"]),
-            image_id=item["image_id"],
-            predicted_class=item["predicted_class"],
-            confidence=item["confidence"],
-            probabilities=item["probabilities"],
-            timestamp=item["timestamp"]
+            **{field: item.get(field) for field in returned_fields}
         )
         for item in histories
     ]
@@ -44,7 +82,7 @@ async def get_user_history(
 @classify_router.get("/histories/{history_id}/detail", response_model=ClassificationDetailedHistoryResponse)
 async def get_detailed_history(
     history_id: str,
-    db: Database = Depends(get_mongo_db),
+    db: AsyncDatabase = Depends(get_async_db),
     user: dict = Depends(get_current_user)
 ):
     try:
@@ -52,14 +90,9 @@ async def get_detailed_history(
     except Exception:
         raise invalid_history_id_exception
     
-    history = db.histories.find_one({
-        "_id": object_id,
-        "user_id": ObjectId(user["_id"])
-    })
+    history = await HistoryRepository(db).get_for_user(object_id, user["_id"])
 
-    explanation = db.explanations.find_one({
-        "history_id": object_id
-    })
+    explanation = await ExplanationRepository(db).get_by_history_id(object_id)
 
     response_data = {
         "id": str(history["_id"]),
@@ -68,6 +101,7 @@ async def get_detailed_history(
         "confidence": history["confidence"],
         "probabilities": history["probabilities"],
         "timestamp": history["timestamp"],
+        "model_version": history.get("model_version"),
         "explanations": []
     }
 
@@ -80,7 +114,7 @@ async def get_detailed_history(
 @classify_router.delete("/histories/{history_id}")
 async def delete_history(
     history_id: str,
-    db: Database = Depends(get_mongo_db),
+    db: AsyncDatabase = Depends(get_async_db),
     user: dict = Depends(get_current_user)
 ):
     try:
@@ -88,27 +122,29 @@ async def delete_history(
     except Exception:
         raise invalid_history_id_exception
 
-    history = db.histories.find_one({
-        "_id": object_id,
-        "user_id": ObjectId(user["_id"])
-    })
+    history = await HistoryRepository(db).get_for_user(object_id, user["_id"])
 
     if not history:
         raise user_history_not_found_exception
 
-    delete_history_with_related(db, object_id)
+    await delete_history_with_related(db, object_id)
     return {"message": "User history and related images deleted"}
     
 
 @classify_router.delete("/histories")
 async def delete_all_histories(
-    db: Database = Depends(get_mongo_db),
+    background_tasks: BackgroundTasks,
+    response: Response,
+    db: AsyncDatabase = Depends(get_async_db),
     user: dict = Depends(get_current_user)
 ):
-    user_id = ObjectId(user["_id"])
-    histories = db.histories.find({"user_id": user_id})
-    
-    for history in histories:
-        delete_history_with_related(db, history["_id"])
+    history_filter = {"user_id": ObjectId(user["_id"])}
+
+    # heavy accounts are cleaned up after the response is sent
+    if await HistoryRepository(db).count(history_filter, limit=HISTORY_DELETE_BACKGROUND_THRESHOLD + 1) > HISTORY_DELETE_BACKGROUND_THRESHOLD:
+        background_tasks.add_task(delete_histories_with_related, db, history_filter)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"message": "Deletion of all user histories and related explanations/images has been scheduled"}
 
+    await delete_histories_with_related(db, history_filter)
     return {"message": "All user histories and related explanations/images deleted"}
\ No newline at end of file
@@ -5,6 +5,7 @@ class ClassificationResponse(BaseModel):
     predicted_class: str
     confidence: float
     probabilities: Dict[str, float]
+    model_version: Optional[str] = None
 
 class ClassificationHistoryResponse(BaseModel):
     id: str
@@ -13,6 +14,16 @@ class ClassificationHistoryResponse(BaseModel):
     confidence: float
     probabilities: Dict[str, float]
     timestamp: str
+    model_version: Optional[str] = None
+
+class ClassificationHistoryListItem(BaseModel):
+    id: str
+    image_id: Optional[str] = None
+    predicted_class: Optional[str] = None
+    confidence: Optional[float] = None
+    probabilities: Optional[Dict[str, float]] = None
+    timestamp: Optional[str] = None
+    model_version: Optional[str] = None
 
 class ClassificationWithHistoryResponse(ClassificationResponse):
     image_id: Optional[str] = None
@@ -1,29 +1,39 @@
-import cv2
 from fastapi import UploadFile, HTTPException, status
 from app.classification.schemas import ClassificationResponse, ClassificationWithHistoryResponse
-from app.classification_models.model_loader import model
+from app.classification_models.model_loader import choose_model, preprocess_input
 from app.constants import CLASS_LABELS, MIN_CONFIDENCE_THRESHOLD
-from app.utils.preprocess_image import load_and_image, load_and_preprocess_image
-from tensorflow.keras.applications.efficientnet import preprocess_input
+from app.utils.preprocess_image import image_content_type, load_and_preprocess_image
 import numpy as np
-from pymongo.database import Database
+from pymongo.asynchronous.database import AsyncDatabase
 from bson import ObjectId
 from datetime import datetime, timezone
 from typing import Optional
 
-from app.utils.saving_images import save_image_to_gridfs
+from app.db.repositories import HistoryRepository, ImageRepository
+from app.utils.workers import run_in_worker
+from app.utils.result_cache import make_cache_key, result_cache
+from starlette.concurrency import run_in_threadpool
 
 async def classify_image(
     file: UploadFile,
-    db: Database,
+    db: AsyncDatabase,
     user: Optional[dict] = None
 ) -> ClassificationWithHistoryResponse:
     file_data = await file.read() 
-    image_np = load_and_preprocess_image(file_data)
-    image_np = np.expand_dims(image_np, axis=0)
-    image_np = preprocess_input(image_np)
-    
-    predictions = model.predict(image_np)[0]
+    model_entry = choose_model(user, file_data)
+    cache_key = make_cache_key(file_data, "classify", model_version=model_entry.version)
+    cached = await run_in_threadpool(result_cache.get, cache_key)
+
+    if cached is not None:
+        predictions = np.asarray(cached["predictions"])
+    else:
+        image_np = await run_in_worker("classify", load_and_preprocess_image, file_data)
+        image_np = np.expand_dims(image_np, axis=0)
+        image_np = preprocess_input(image_np)
+
+        predictions = (await model_entry.predictor.predict_async(image_np))[0]
+        await run_in_threadpool(result_cache.set, cache_key, {"predictions": predictions.tolist()})
+
     pred_class_idx = np.argmax(predictions)
     confidence = float(predictions[pred_class_idx])
     probabilities = {CLASS_LABELS[i]: float(predictions[i]) for i in range(len(CLASS_LABELS))}
@@ -37,25 +47,24 @@ async def classify_image(
     result = ClassificationResponse(
         predicted_class=CLASS_LABELS[pred_class_idx],
         confidence=confidence,
-        probabilities=probabilities
-        
+        probabilities=probabilities,
+        model_version=model_entry.version
     )
     history_id = None
     image_id = None
     if user:
         filename = f"{file.filename}"
-        image_np = load_and_image(file_data)
-        image_bgr = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
-        image_id = save_image_to_gridfs(db, image_bgr, filename)
+        # the upload is stored as sent, without decoding it again or re-encoding to PNG
+        image_id = await ImageRepository(db).upload(file_data, filename, content_type=image_content_type(file_data))
 
-        inserted = db.histories.insert_one({
+        history_id = await HistoryRepository(db).create({
             "image_id": image_id,
             "user_id": ObjectId(user["_id"]),
             "predicted_class": result.predicted_class,
             "confidence": result.confidence,
             "probabilities": result.probabilities,
+            "model_version": model_entry.version,
             "timestamp": datetime.now(timezone.utc).isoformat()
         })
-        history_id = str(inserted.inserted_id)
 
     return ClassificationWithHistoryResponse(**result.model_dump(), history_id=history_id, image_id=image_id)
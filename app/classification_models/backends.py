@@ -0,0 +1,172 @@
+import importlib.util
+import os
+import threading
+
+import numpy as np
+
+from app.classification_models.config import MODEL_INTER_OP_THREADS, MODEL_NUM_THREADS, TFLITE_MAX_BATCH_SIZE
+
+BACKEND_EXTENSIONS = {"tflite": ".tflite", "onnx": ".onnx"}
+# packages that can run each backend, any one of them is enough
+BACKEND_MODULES = {"keras": ("tensorflow",), "tflite": ("tflite_runtime", "tensorflow"), "onnx": ("onnxruntime",)}
+
+_tf_threads_configured = False
+
+
+def configure_tf_threads(num_threads: int = MODEL_NUM_THREADS, inter_op_threads: int = MODEL_INTER_OP_THREADS):
+    # only possible before TensorFlow runs its first op, so it is done once, right before loading
+    global _tf_threads_configured
+    if _tf_threads_configured:
+        return
+    _tf_threads_configured = True
+
+    import tensorflow as tf
+
+    try:
+        if num_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError:
+        pass
+
+
+def check_backend(backend: str):
+    # run while reading the manifest, so a missing runtime fails the deploy instead of the first request
+    modules = BACKEND_MODULES.get(backend)
+    if modules is None:
+        raise ValueError(f"Unknown model backend: {backend}")
+    if not any(importlib.util.find_spec(module) for module in modules):
+        raise ImportError(f"Model backend {backend!r} needs one of: {', '.join(modules)}")
+
+
+def artifact_path(model_path: str, backend: str) -> str:
+    return os.path.splitext(model_path)[0] + BACKEND_EXTENSIONS[backend]
+
+
+# Every backend takes a preprocessed float32 NHWC batch and returns class probabilities,
+# so BatchingPredictor can drive any of them through predict_on_batch.
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+def chunk_size(size: int, max_size: int) -> int:
+    # largest power of two that fits, so any batch splits into a handful of fixed shapes
+    return min(max_size, 1 << (size.bit_length() - 1))
+
+
+# One interpreter with tensors allocated for a single batch size. Interpreters are not
+# thread-safe, so each one has its own lock.
+class TFLiteRunner:
+    def __init__(self, interpreter_cls, path: str, batch_size: int, num_threads: int = MODEL_NUM_THREADS):
+        self.interpreter = interpreter_cls(model_path=path, num_threads=num_threads or None)
+        input_details = self.interpreter.get_input_details()[0]
+        if int(input_details["shape"][0]) != batch_size:
+            shape = [batch_size, *input_details["shape"][1:]]
+            self.interpreter.resize_tensor_input(input_details["index"], shape, strict=False)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._lock = threading.Lock()
+
+    def run(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self.interpreter.set_tensor(self.input["index"], batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output["index"]).astype(np.float32)
+
+
+# Batches are split into power-of-two chunks (a 100-image Anchor batch runs as 64 + 32 + 4),
+# each on the interpreter allocated for that size. Nothing is resized or re-allocated per
+# call, and a single-image classification never waits behind an explainer's 64-image chunk.
+class TFLiteBackend:
+    name = "tflite"
+
+    def __init__(self, path: str, num_threads: int = MODEL_NUM_THREADS, max_batch_size: int = TFLITE_MAX_BATCH_SIZE):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.interpreter_cls = Interpreter
+        self.path = path
+        self.num_threads = num_threads
+        self.max_batch_size = max_batch_size
+        self._runners = {}
+        self._runners_lock = threading.Lock()
+        self.dtype = self.runner(1).input["dtype"]
+
+    def runner(self, batch_size: int) -> TFLiteRunner:
+        runner = self._runners.get(batch_size)
+        if runner is None:
+            with self._runners_lock:
+                runner = self._runners.get(batch_size)
+                if runner is None:
+                    runner = self._runners[batch_size] = TFLiteRunner(
+                        self.interpreter_cls, self.path, batch_size, self.num_threads
+                    )
+        return runner
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=self.dtype)
+        outputs = []
+        start = 0
+        while start < len(batch):
+            size = chunk_size(len(batch) - start, self.max_batch_size)
+            outputs.append(self.runner(size).run(batch[start:start + size]))
+            start += size
+        return np.concatenate(outputs) if len(outputs) > 1 else outputs[0]
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, path: str, num_threads: int = MODEL_NUM_THREADS, inter_op_threads: int = MODEL_INTER_OP_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return np.asarray(self.session.run(None, {self.input_name: batch})[0], dtype=np.float32)
+
+
+def load_backend(backend: str, path: str):
+    if backend == "tflite":
+        return TFLiteBackend(path)
+    if backend == "onnx":
+        return OnnxBackend(path)
+    raise ValueError(f"Unknown model backend: {backend}")
+
+
+def check_parity(keras_model, backend, samples: np.ndarray, batch_size: int = 8) -> dict:
+    # compares the exported runtime with the keras model on the same preprocessed inputs
+    expected, actual = [], []
+    for start in range(0, len(samples), batch_size):
+        batch = samples[start:start + batch_size]
+        expected.append(np.asarray(keras_model.predict_on_batch(batch)))
+        actual.append(backend.predict_on_batch(batch))
+    expected = np.concatenate(expected)
+    actual = np.concatenate(actual)
+
+    return {
+        "samples": int(len(samples)),
+        "top1_agreement": float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1))),
+        "max_abs_diff": float(np.max(np.abs(expected - actual))),
+        "mean_abs_diff": float(np.mean(np.abs(expected - actual)))
+    }
@@ -0,0 +1,119 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from app.classification_models.config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+
+
+# Collects concurrent predict calls for a few milliseconds and runs them as one
+# forward pass on a dedicated thread, usable from the event loop and from threads.
+class BatchingPredictor:
+    def __init__(self, get_model, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, on_batch=None):
+        # resolved on the worker thread, so the model is only loaded once a batch arrives
+        self.get_model = get_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        # called with (seconds, batch size) after every forward pass
+        self.on_batch = on_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._closed = False
+
+    def submit(self, image_batch) -> Future:
+        future = Future()
+        self._queue.put((np.asarray(image_batch, dtype=np.float32), future))
+        self._ensure_worker()
+        return future
+
+    def predict(self, image_batch) -> np.ndarray:
+        return self.submit(image_batch).result()
+
+    async def predict_async(self, image_batch) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(image_batch))
+
+    def close(self):
+        # the worker finishes what is already queued, then exits
+        self._closed = True
+        self._queue.put(None)
+
+    def _exit_if_idle(self) -> bool:
+        with self._lock:
+            if not self._queue.empty():
+                return False
+            self._worker = None
+            return True
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="batching-predictor", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return []
+        items = [item]
+        size = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            items.append(item)
+            size += len(item[0])
+
+        return items
+
+    def _pad_to_bucket(self, batch):
+        # Pad to the next power of two so the model sees a handful of shapes
+        # instead of retracing for every batch size.
+        size = len(batch)
+        bucket = 1
+        while bucket < size:
+            bucket *= 2
+        if bucket == size or size > self.max_batch_size:
+            return batch
+        padding = np.zeros((bucket - size, *batch.shape[1:]), dtype=batch.dtype)
+        return np.concatenate([batch, padding], axis=0)
+
+    def _run(self):
+        while True:
+            items = [(x, f) for x, f in self._collect() if f.set_running_or_notify_cancel()]
+            if items:
+                self._predict(items)
+            if self._closed and self._exit_if_idle():
+                return
+
+    def _predict(self, items):
+        try:
+            batch = np.concatenate([x for x, _ in items], axis=0)
+            model = self.get_model()
+            started = time.perf_counter()
+            preds = np.asarray(model.predict_on_batch(self._pad_to_bucket(batch)))
+            if self.on_batch:
+                self.on_batch(time.perf_counter() - started, len(batch))
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for x, future in items:
+            future.set_result(preds[offset:offset + len(x)])
+            offset += len(x)
+
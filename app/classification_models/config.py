@@ -0,0 +1,34 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+
+# eager: load in the background as soon as the app starts; lazy: load on the first request
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "eager")
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+
+# Optional JSON manifest with several models and their traffic weights, e.g.
+# {"models": [{"name": "resnet", "path": "resnet_model.h5", "weight": 90},
+#             {"name": "resnet-v2", "path": "resnet_v2.h5", "weight": 10}]}
+# Without it the single resnet_model.h5 serves all traffic.
+MODEL_MANIFEST_PATH = os.getenv("MODEL_MANIFEST_PATH", "")
+# how often the manifest and weight files are checked for changes (0 disables hot-swap)
+MODEL_RELOAD_INTERVAL_SECONDS = float(os.getenv("MODEL_RELOAD_INTERVAL_SECONDS", 30))
+# replaced models stay available this long for requests that already picked them
+MODEL_RETIRE_GRACE_SECONDS = float(os.getenv("MODEL_RETIRE_GRACE_SECONDS", 300))
+MODEL_LATENCY_WINDOW = int(os.getenv("MODEL_LATENCY_WINDOW", 1000))
+
+# keras | tflite | onnx — runtime used for classification forward passes;
+# the explainers always use the keras model because they need gradients
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "keras")
+# exported artifact for the tflite/onnx backends, defaults to the weights path with .tflite/.onnx
+MODEL_ARTIFACT_PATH = os.getenv("MODEL_ARTIFACT_PATH", "")
+# 0 leaves the runtime default (all cores)
+MODEL_NUM_THREADS = int(os.getenv("MODEL_NUM_THREADS", 0))
+MODEL_INTER_OP_THREADS = int(os.getenv("MODEL_INTER_OP_THREADS", 0))
+# largest interpreter batch of the tflite backend; bigger batches run as several chunks
+TFLITE_MAX_BATCH_SIZE = int(os.getenv("TFLITE_MAX_BATCH_SIZE", 64))
+MODEL_PARITY_MIN_AGREEMENT = float(os.getenv("MODEL_PARITY_MIN_AGREEMENT", 0.99))
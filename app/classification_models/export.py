@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from app.classification_models.backends import artifact_path, check_parity, load_backend
+from app.classification_models.config import MODEL_PARITY_MIN_AGREEMENT
+from app.classification_models.model_loader import model_path, preprocess_input
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+# Usage:
+#   python -m app.classification_models.export --format tflite --quantize float16 --samples data/val
+#   python -m app.classification_models.export --format onnx --quantize int8
+# then serve it with MODEL_BACKEND=tflite|onnx (and MODEL_ARTIFACT_PATH if it was written elsewhere).
+
+def export_tflite(model, output: str, quantize: str):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        # dynamic range quantization: int8 weights, float activations, no calibration set needed
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    with open(output, "wb") as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model, output: str, quantize: str):
+    import tensorflow as tf
+
+    float_output = output if quantize == "none" else f"{output}.float32"
+    if hasattr(model, "export"):
+        # keras 3
+        model.export(float_output, format="onnx")
+    else:
+        import tf2onnx
+
+        spec = (tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name="input"),)
+        tf2onnx.convert.from_keras(model, input_signature=spec, output_path=float_output)
+
+    if quantize == "int8":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(float_output, output, weight_type=QuantType.QInt8)
+    elif quantize == "float16":
+        import onnx
+        from onnxconverter_common import float16
+
+        converted = float16.convert_float_to_float16(onnx.load(float_output), keep_io_types=True)
+        onnx.save(converted, output)
+
+    if float_output != output:
+        os.remove(float_output)
+
+
+def load_samples(samples_dir: str, count: int, input_shape) -> np.ndarray:
+    if not samples_dir:
+        # no labelled set at hand: random images still catch broken conversions
+        rng = np.random.default_rng(0)
+        images = rng.uniform(0, 255, size=(count, *input_shape)).astype(np.float32)
+        return preprocess_input(images)
+
+    from app.utils.preprocess_image import load_and_preprocess_image
+
+    files = sorted(
+        os.path.join(samples_dir, name) for name in os.listdir(samples_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )[:count]
+    if not files:
+        raise ValueError(f"No images found in {samples_dir}")
+
+    images = []
+    for file in files:
+        with open(file, "rb") as f:
+            images.append(load_and_preprocess_image(f.read()))
+    return preprocess_input(np.stack(images).astype(np.float32))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export the classifier to an optimized CPU runtime")
+    parser.add_argument("--format", choices=["tflite", "onnx"], required=True)
+    parser.add_argument("--quantize", choices=["none", "float16", "int8"], default="none")
+    parser.add_argument("--model", default=model_path, help="Keras .h5 weights to export")
+    parser.add_argument("--output", help="Artifact path, defaults to the model path with the format's extension")
+    parser.add_argument("--samples", help="Directory of images for the parity check")
+    parser.add_argument("--sample-count", type=int, default=64)
+    parser.add_argument("--min-agreement", type=float, default=MODEL_PARITY_MIN_AGREEMENT)
+    args = parser.parse_args(argv)
+
+    from tensorflow.keras.models import load_model
+
+    model = load_model(args.model)
+    output = args.output or artifact_path(args.model, args.format)
+
+    if args.format == "tflite":
+        export_tflite(model, output, args.quantize)
+    else:
+        export_onnx(model, output, args.quantize)
+
+    samples = load_samples(args.samples, args.sample_count, model.input_shape[1:])
+    report = check_parity(model, load_backend(args.format, output), samples)
+    report.update({"artifact": output, "format": args.format, "quantize": args.quantize})
+    print(json.dumps(report, indent=2))
+
+    if report["top1_agreement"] < args.min_agreement:
+        print(f"Parity check failed: top-1 agreement below {args.min_agreement}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,429 @@
-from tensorflow.keras.models import load_model
+import hashlib
+import json
 import os
+import random
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Dict, List, Optional
 
-model_path = os.path.join(os.path.dirname(__file__), "resnet_model.h5")
-model = load_model(model_path)
+import numpy as np
+
+from app.classification_models.backends import (
+    BACKEND_EXTENSIONS,
+    KerasBackend,
+    artifact_path,
+    check_backend,
+    configure_tf_threads,
+    load_backend
+)
+from app.classification_models.batching import BatchingPredictor
+from app.classification_models.config import (
+    MODEL_ARTIFACT_PATH,
+    MODEL_BACKEND,
+    MODEL_LATENCY_WINDOW,
+    MODEL_LOAD_MODE,
+    MODEL_MANIFEST_PATH,
+    MODEL_RETIRE_GRACE_SECONDS,
+    MODEL_WARMUP
+)
+from app.classification_models.models import ModelSpec
+
+MODELS_DIR = os.path.dirname(__file__)
+model_path = os.path.join(MODELS_DIR, "resnet_model.h5")
+
+
+def file_version(path: str) -> str:
+    # Changes whenever the weights file is replaced, so cached results never outlive the model
+    try:
+        return f"{os.path.basename(path)}@{int(os.path.getmtime(path))}"
+    except OSError:
+        # reported as a load error on the entry, not while reading the manifest
+        return os.path.basename(path)
+
+
+def with_backend(spec: ModelSpec) -> ModelSpec:
+    check_backend(spec.backend)
+    # an exported runtime gives slightly different outputs, so it is part of the version
+    if spec.backend == "keras":
+        return spec
+    if not spec.artifact_path and spec.backend in BACKEND_EXTENSIONS:
+        spec.artifact_path = artifact_path(spec.path, spec.backend)
+    spec.version = f"{spec.version}+{file_version(spec.artifact_path)}"
+    return spec
+
+
+class ModelStats:
+    def __init__(self, window: int = MODEL_LATENCY_WINDOW):
+        self.batches = 0
+        self.images = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, batch_size: int):
+        with self._lock:
+            self.batches += 1
+            self.images += batch_size
+            self.latencies.append(seconds)
+
+    def summary(self) -> dict:
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000.0
+            batches, images = self.batches, self.images
+        summary = {"batches": batches, "images": images}
+        if len(latencies):
+            summary.update({
+                "latency_mean_ms": round(float(latencies.mean()), 2),
+                "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2)
+            })
+        return summary
+
+
+# One loaded version of one model, with its own batching queue and latency stats.
+# Classification runs on the configured backend; the explainers use the keras model.
+class ModelEntry:
+    def __init__(self, spec: ModelSpec, warmup: bool = MODEL_WARMUP):
+        self.spec = spec
+        self.warmup = warmup
+        self.model = None
+        self.backend = None
+        self.error = None
+        self.load_seconds = None
+        self.stats = ModelStats()
+        self.predictor = BatchingPredictor(self.get_backend, on_batch=self.stats.record)
+        # explainer engines built around this model or backend (Grad-CAM sub-models,
+        # traced IG gradients, SHAP/Anchor pools); they keep it alive, so they live here
+        self.engines = {}
+        self.closed = False
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.spec.name
+
+    @property
+    def version(self) -> str:
+        return self.spec.version
+
+    @property
+    def ready(self) -> bool:
+        return self.model is not None and self.backend is not None
+
+    def get(self):
+        if self.model is None:
+            self.load()
+        return self.model
+
+    def get_backend(self):
+        if self.backend is None:
+            self.load()
+        return self.backend
+
+    def engine(self, key, factory):
+        engine = self.engines.get(key)
+        if engine is None:
+            with self._lock:
+                engine = self.engines.get(key)
+                if engine is None:
+                    engine = self.engines[key] = factory()
+        return engine
+
+    def owns(self, obj) -> bool:
+        return obj is not None and (obj is self.model or obj is self.backend)
+
+    def load(self):
+        with self._lock:
+            if self.ready:
+                return self.model
+            if self.closed:
+                raise RuntimeError(f"Model version {self.version} has been retired")
+            started = time.perf_counter()
+            try:
+                configure_tf_threads()
+                from tensorflow.keras.models import load_model
+
+                model = load_model(self.spec.path)
+                if self.spec.backend == "keras":
+                    backend = KerasBackend(model)
+                elif not os.path.exists(self.spec.artifact_path or ""):
+                    raise FileNotFoundError(f"Exported {self.spec.backend} model not found: {self.spec.artifact_path}")
+                else:
+                    backend = load_backend(self.spec.backend, self.spec.artifact_path)
+                if self.warmup:
+                    warm_up(model)
+                    if self.spec.backend != "keras":
+                        backend.predict_on_batch(np.zeros((1, *model.input_shape[1:]), dtype=np.float32))
+            except Exception as e:
+                self.error = str(e)
+                raise
+            self.error = None
+            self.load_seconds = time.perf_counter() - started
+            self.model = model
+            self.backend = backend
+            return model
+
+    def close(self):
+        self.predictor.close()
+        # drop every reference to the retired model, so its weights and graphs can be freed
+        with self._lock:
+            self.closed = True
+            self.engines.clear()
+            self.model = None
+            self.backend = None
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "weight": self.spec.weight,
+            "backend": self.spec.backend,
+            "ready": self.ready,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            **self.stats.summary()
+        }
+
+
+# Holds every served model by name. Models are loaded on first use or from the
+# app lifespan, so importing the app (workers, CLI, tests) does not pay for TensorFlow.
+# refresh() re-reads the manifest and weight files and swaps changed models in
+# atomically; requests that already picked a version keep using it.
+class ModelRegistry:
+    def __init__(self, manifest_path: str = MODEL_MANIFEST_PATH, retire_grace: float = MODEL_RETIRE_GRACE_SECONDS):
+        self.manifest_path = manifest_path
+        self.retire_grace = retire_grace
+        self.reload_error = None
+        self._active: Dict[str, ModelEntry] = {}
+        self._retired = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loader = None
+        self._watcher = None
+        self._stop = threading.Event()
+        self.refresh()
+
+    def read_specs(self) -> List[ModelSpec]:
+        if not self.manifest_path:
+            return [with_backend(ModelSpec(
+                name=os.path.splitext(os.path.basename(model_path))[0],
+                path=model_path,
+                version=os.getenv("MODEL_VERSION") or file_version(model_path),
+                backend=MODEL_BACKEND,
+                artifact_path=MODEL_ARTIFACT_PATH
+            ))]
+
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+
+        base_dir = os.path.dirname(os.path.abspath(self.manifest_path))
+        specs = []
+        for item in manifest["models"]:
+            path = item["path"] if os.path.isabs(item["path"]) else os.path.join(base_dir, item["path"])
+            version = item.get("version") or file_version(path)
+            artifact = item.get("artifact", "")
+            if artifact and not os.path.isabs(artifact):
+                artifact = os.path.join(base_dir, artifact)
+            specs.append(with_backend(ModelSpec(
+                name=item["name"],
+                path=path,
+                version=f"{item['name']}:{version}",
+                weight=float(item.get("weight", 100.0)),
+                backend=item.get("backend", MODEL_BACKEND),
+                artifact_path=artifact
+            )))
+        if not specs:
+            raise ValueError("Model manifest lists no models")
+        return specs
+
+    def refresh(self, load: bool = False) -> bool:
+        with self._refresh_lock:
+            self._drop_retired()
+            specs = self.read_specs()
+            current = self._active
+            entries = {}
+            fresh = []
+
+            for spec in specs:
+                entry = current.get(spec.name)
+                if entry is None or entry.version != spec.version or entry.spec.path != spec.path:
+                    entry = ModelEntry(spec)
+                    fresh.append(entry)
+                else:
+                    # weight changes only move traffic, the loaded model is kept
+                    entry.spec = spec
+                entries[spec.name] = entry
+
+            if not fresh and entries.keys() == current.keys():
+                return False
+
+            self.reload_error = None
+            for entry in fresh:
+                if not load:
+                    continue
+                try:
+                    entry.load()
+                except Exception as e:
+                    self.reload_error = f"{entry.version}: {e}"
+                    if entry.name in current:
+                        # keep serving the previous version of this model
+                        entries[entry.name] = current[entry.name]
+
+            with self._lock:
+                replaced = [entry for name, entry in current.items() if entries.get(name) is not entry]
+                self._active = entries
+                now = time.monotonic()
+                self._retired.extend((now, entry) for entry in replaced)
+            return True
+
+    def _drop_retired(self):
+        deadline = time.monotonic() - self.retire_grace
+        with self._lock:
+            expired = [entry for retired_at, entry in self._retired if retired_at < deadline]
+            self._retired = [(retired_at, entry) for retired_at, entry in self._retired if retired_at >= deadline]
+        for entry in expired:
+            entry.close()
+
+    def entries(self) -> List[ModelEntry]:
+        return list(self._active.values())
+
+    def default(self) -> ModelEntry:
+        return self.entries()[0]
+
+    def _find(self, version: str) -> Optional[ModelEntry]:
+        with self._lock:
+            candidates = list(self._active.values()) + [entry for _, entry in self._retired]
+        return next((entry for entry in candidates if entry.version == version), None)
+
+    def owner(self, obj) -> Optional[ModelEntry]:
+        with self._lock:
+            candidates = list(self._active.values()) + [entry for _, entry in self._retired]
+        return next((entry for entry in candidates if entry.owns(obj)), None)
+
+    def has(self, version: str) -> bool:
+        return self._find(version) is not None
+
+    def entry(self, version: Optional[str] = None) -> ModelEntry:
+        if version is None:
+            return self.default()
+        found = self._find(version)
+        # e.g. a process-pool worker that has not seen the latest manifest yet
+        if found is None and self.refresh():
+            found = self._find(version)
+        if found is None:
+            raise KeyError(f"Unknown model version: {version}")
+        return found
+
+    def get(self, version: Optional[str] = None):
+        return self.entry(version).get()
+
+    def choose(self, routing_key: Optional[str] = None) -> ModelEntry:
+        entries = self.entries()
+        total = sum(max(entry.spec.weight, 0.0) for entry in entries)
+        if len(entries) == 1 or total <= 0:
+            return entries[0]
+
+        # the same key always lands on the same model while the weights stay the same
+        if routing_key is None:
+            point = random.random() * total
+        else:
+            point = (zlib.crc32(routing_key.encode()) % 10000) / 10000.0 * total
+
+        for entry in entries:
+            point -= max(entry.spec.weight, 0.0)
+            if point < 0:
+                return entry
+        return entries[-1]
+
+    @property
+    def ready(self) -> bool:
+        return all(entry.ready for entry in self.entries())
+
+    @property
+    def error(self) -> Optional[str]:
+        return next((entry.error for entry in self.entries() if entry.error), None)
+
+    def load_all(self):
+        for entry in self.entries():
+            entry.load()
+
+    def load_in_background(self):
+        if self.ready or (self._loader and self._loader.is_alive()):
+            return
+        self._loader = threading.Thread(target=self._load_quietly, name="model-loader", daemon=True)
+        self._loader.start()
+
+    def _load_quietly(self):
+        try:
+            self.load_all()
+        except Exception:
+            # kept on the entry and reported by /health/ready
+            pass
+
+    def start_watcher(self, interval: float):
+        if interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh(load=MODEL_LOAD_MODE == "eager")
+            except Exception as e:
+                self.reload_error = str(e)
+
+    def describe(self) -> dict:
+        with self._lock:
+            retired = [entry.version for _, entry in self._retired]
+        return {
+            "models": [entry.describe() for entry in self.entries()],
+            "retired": retired,
+            "reload_error": self.reload_error
+        }
+
+
+def warm_up(model):
+    # One forward and one gradient pass, so the first request does not build the graphs
+    import tensorflow as tf
+
+    sample = tf.zeros((1, *model.input_shape[1:]), dtype=tf.float32)
+    model.predict_on_batch(sample)
+    with tf.GradientTape() as tape:
+        tape.watch(sample)
+        preds = model(sample, training=False)
+        top = tf.reduce_max(preds, axis=-1)
+    tape.gradient(top, sample)
+
+
+def preprocess_input(image: np.ndarray) -> np.ndarray:
+    from tensorflow.keras.applications.efficientnet import preprocess_input as keras_preprocess_input
+
+    return keras_preprocess_input(image)
+
+
+registry = ModelRegistry()
+
+
+def get_model(version: Optional[str] = None):
+    return registry.get(version)
+
+
+def model_engine(model, key, factory):
+    # cached on the ModelEntry that owns the model or backend, and released with it;
+    # models not served by the registry (scripts, notebooks) get a fresh engine
+    entry = registry.owner(model)
+    if entry is None:
+        return factory()
+    return entry.engine(key, factory)
+
+
+def choose_model(user: Optional[dict] = None, image_data: bytes = b"") -> ModelEntry:
+    # signed-in users stay on one model for the whole A/B split, anonymous requests are split per image
+    routing_key = str(user["_id"]) if user else hashlib.sha256(image_data).hexdigest()
+    return registry.choose(routing_key)
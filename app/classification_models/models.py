@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class ModelSpec:
+    name: str
+    path: str
+    version: str
+    weight: float = 100.0
+    backend: str = "keras"
+    artifact_path: str = ""
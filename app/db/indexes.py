@@ -0,0 +1,10 @@
+from pymongo import ASCENDING, DESCENDING
+from pymongo.asynchronous.database import AsyncDatabase
+
+
+async def ensure_indexes(db: AsyncDatabase):
+    await db.histories.create_index([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)])
+    await db.explanations.create_index([("history_id", ASCENDING)])
+    # entries disappear once every token of the session has expired anyway
+    await db.revoked_sessions.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    await db.revoked_sessions.create_index([("revoked_at", ASCENDING)])
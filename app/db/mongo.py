@@ -1,8 +1,52 @@
-from pymongo import MongoClient
-from app.db.config import MONGODB_URL, MONGO_DB_NAME
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.asynchronous.database import AsyncDatabase
+from app.db.config import (
+    MONGODB_URL,
+    MONGO_DB_NAME,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_READ_PREFERENCE
+)
 
-client = MongoClient(MONGODB_URL)
+CLIENT_OPTIONS = {
+    "maxPoolSize": MONGO_MAX_POOL_SIZE,
+    "minPoolSize": MONGO_MIN_POOL_SIZE,
+    "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+    "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+    "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+    "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    "readPreference": MONGO_READ_PREFERENCE,
+}
+
+# Synchronous client for code that runs in worker threads (e.g. the result cache)
+client = MongoClient(MONGODB_URL, connect=False, **CLIENT_OPTIONS)
 db = client[MONGO_DB_NAME]
 
+async_client: AsyncMongoClient = None
+
+
 def get_mongo_db():
-    return db
\ No newline at end of file
+    return db
+
+
+async def connect_async_client():
+    global async_client
+    if async_client is None:
+        async_client = AsyncMongoClient(MONGODB_URL, **CLIENT_OPTIONS)
+    return async_client
+
+
+async def close_async_client():
+    global async_client
+    if async_client is not None:
+        await async_client.close()
+        async_client = None
+
+
+async def get_async_db() -> AsyncDatabase:
+    client = await connect_async_client()
+    return client[MONGO_DB_NAME]
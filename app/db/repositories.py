@@ -0,0 +1,134 @@
+from datetime import datetime
+from typing import List, Optional
+from bson import ObjectId
+from gridfs import AsyncGridFSBucket
+from pymongo.asynchronous.database import AsyncDatabase
+
+
+class UserRepository:
+    def __init__(self, db: AsyncDatabase):
+        self.collection = db.users
+
+    async def get_by_id(self, user_id) -> Optional[dict]:
+        return await self.collection.find_one({"_id": ObjectId(user_id)})
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email})
+
+    async def create(self, user: dict) -> str:
+        result = await self.collection.insert_one(user)
+        return str(result.inserted_id)
+
+    async def update(self, user_id, values: dict) -> int:
+        result = await self.collection.update_one({"_id": ObjectId(user_id)}, {"$set": values})
+        return result.modified_count
+
+    async def delete(self, user_id) -> int:
+        result = await self.collection.delete_one({"_id": ObjectId(user_id)})
+        return result.deleted_count
+
+
+class RevokedSessionRepository:
+    def __init__(self, db: AsyncDatabase):
+        self.collection = db.revoked_sessions
+
+    async def revoke(self, session_id: str, expires_at: datetime, revoked_at: datetime):
+        await self.collection.update_one(
+            {"_id": session_id},
+            {"$set": {"expires_at": expires_at, "revoked_at": revoked_at}},
+            upsert=True
+        )
+
+    async def find_since(self, revoked_at: Optional[datetime] = None) -> List[dict]:
+        query = {"revoked_at": {"$gte": revoked_at}} if revoked_at else {}
+        return await self.collection.find(query, {"expires_at": 1, "revoked_at": 1}).to_list()
+
+
+class HistoryRepository:
+    def __init__(self, db: AsyncDatabase):
+        self.collection = db.histories
+
+    async def create(self, history: dict) -> str:
+        result = await self.collection.insert_one(history)
+        return str(result.inserted_id)
+
+    async def get_for_user(self, history_id: ObjectId, user_id) -> Optional[dict]:
+        return await self.collection.find_one({"_id": history_id, "user_id": ObjectId(user_id)})
+
+    async def find(self, query: dict, projection: Optional[dict] = None, sort: Optional[list] = None, limit: int = 0) -> List[dict]:
+        cursor = self.collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list()
+
+    async def count(self, query: dict, limit: int = 0) -> int:
+        if limit:
+            return await self.collection.count_documents(query, limit=limit)
+        return await self.collection.count_documents(query)
+
+    async def aggregate(self, pipeline: list) -> List[dict]:
+        cursor = await self.collection.aggregate(pipeline, allowDiskUse=True)
+        return await cursor.to_list()
+
+    async def delete_many(self, history_ids: list) -> int:
+        result = await self.collection.delete_many({"_id": {"$in": history_ids}})
+        return result.deleted_count
+
+
+class ExplanationRepository:
+    def __init__(self, db: AsyncDatabase):
+        self.collection = db.explanations
+
+    async def get_by_history_id(self, history_id) -> Optional[dict]:
+        return await self.collection.find_one({"history_id": ObjectId(history_id)})
+
+    async def set_explanations(self, history_id, explanations: List[dict]):
+        await self.collection.update_one(
+            {"history_id": ObjectId(history_id)},
+            {"$set": {"explanations": explanations}},
+            upsert=True
+        )
+
+    async def delete_many(self, history_ids: list) -> int:
+        result = await self.collection.delete_many({"history_id": {"$in": history_ids}})
+        return result.deleted_count
+
+
+class ImageRepository:
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+        self.bucket = AsyncGridFSBucket(db)
+
+    async def upload(self, data: bytes, filename: str, content_type: Optional[str] = None, metadata: Optional[dict] = None) -> str:
+        metadata = dict(metadata or {})
+        if content_type:
+            metadata["contentType"] = content_type
+        metadata = metadata or None
+        file_id = await self.bucket.upload_from_stream(filename, data, metadata=metadata)
+        return str(file_id)
+
+    async def open(self, image_id):
+        return await self.bucket.open_download_stream(ObjectId(image_id))
+
+    async def download(self, image_id) -> bytes:
+        grid_out = await self.open(image_id)
+        return await grid_out.read()
+
+    async def delete(self, image_id):
+        await self.db.fs.files.delete_one({"_id": ObjectId(image_id)})
+        await self.db.fs.chunks.delete_many({"files_id": ObjectId(image_id)})
+
+    async def delete_many(self, file_ids: List[ObjectId]) -> int:
+        # chunks first: an interrupted delete leaves a files entry to retry, never unreachable chunks
+        await self.db.fs.chunks.delete_many({"files_id": {"$in": file_ids}})
+        result = await self.db.fs.files.delete_many({"_id": {"$in": file_ids}})
+        return result.deleted_count
+
+    async def list_files(self) -> List[dict]:
+        return await self.db.fs.files.find({}, {"filename": 1, "uploadDate": 1}).to_list()
+
+    async def delete_all(self):
+        await self.db.fs.chunks.delete_many({})
+        await self.db.fs.files.delete_many({})
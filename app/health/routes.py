@@ -0,0 +1,50 @@
+import asyncio
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
+from pymongo.asynchronous.database import AsyncDatabase
+from app.classification_models.config import MODEL_LOAD_MODE
+from app.classification_models.model_loader import registry
+from app.db.mongo import get_async_db
+
+HEALTH_DB_TIMEOUT_SECONDS = 2
+
+health_router = APIRouter()
+
+
+@health_router.get("/live")
+async def liveness():
+    return {"status": "alive"}
+
+
+@health_router.get("/ready")
+async def readiness(db: AsyncDatabase = Depends(get_async_db)):
+    checks = {
+        "model": "ready" if registry.ready else ("failed" if registry.error else "loading"),
+        "database": "ready"
+    }
+
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=HEALTH_DB_TIMEOUT_SECONDS)
+    except Exception:
+        checks["database"] = "unavailable"
+
+    # in lazy mode the model is loaded by the first request, so it does not gate readiness
+    model_ok = registry.ready or (MODEL_LOAD_MODE == "lazy" and not registry.error)
+    ready = model_ok and checks["database"] == "ready"
+
+    content = {
+        "status": "ready" if ready else "not ready",
+        "checks": checks,
+        "model_versions": [entry.version for entry in registry.entries()],
+        "error": registry.error
+    }
+    return JSONResponse(
+        content=content,
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+@health_router.get("/models")
+async def models():
+    # per-version traffic weight, load state and forward-pass latency, for comparing A/B rollouts
+    return registry.describe()
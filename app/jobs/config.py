@@ -0,0 +1,13 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOBS_WORKER_MODE = os.getenv("JOBS_WORKER_MODE", "local")  # local | external
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", 2))
+JOBS_POLL_INTERVAL_SECONDS = float(os.getenv("JOBS_POLL_INTERVAL_SECONDS", 1))
+# renewed by the worker every third of it while the job runs
+JOBS_LEASE_SECONDS = int(os.getenv("JOBS_LEASE_SECONDS", 600))
+# longest pause after repeated worker errors (e.g. Mongo unreachable)
+JOBS_MAX_BACKOFF_SECONDS = float(os.getenv("JOBS_MAX_BACKOFF_SECONDS", 30))
+JOBS_RESULT_TTL_HOURS = int(os.getenv("JOBS_RESULT_TTL_HOURS", 24))
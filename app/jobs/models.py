@@ -0,0 +1,28 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+@dataclass
+class Job:
+    method: str
+    input_image_id: str
+    filename: str
+    user_id: Optional[str] = None
+    access_token_hash: Optional[str] = None  # anonymous jobs: sha256 of the token given to the submitter
+    history_id: Optional[str] = None
+    model_version: Optional[str] = None
+    status: str = JOB_QUEUED
+    progress: float = 0.0
+    stage: str = JOB_QUEUED
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    claim: Optional[str] = None  # token of the worker run currently holding the job
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    expires_at: Optional[datetime] = None
@@ -0,0 +1,73 @@
+from fastapi import APIRouter, UploadFile, File, Depends, Form, Header, HTTPException, status
+from app.auth.dependencies import get_current_user_optional
+from app.db.mongo import get_async_db
+from app.jobs.models import JOB_QUEUED, JOB_DONE, JOB_FAILED
+from app.jobs.schemas import JobCreatedResponse, JobStatusResponse
+from app.jobs.service import create_job, get_job, job_to_response
+from app.utils.exceptions import (
+    invalid_job_id_exception,
+    job_not_finished_exception,
+    unsupported_xai_method_exception
+)
+from app.xai.schemas import XAIResponse
+from app.xai.service import XAI_METHODS, resolve_model_version
+from typing import Optional
+from pymongo.asynchronous.database import AsyncDatabase
+from bson import ObjectId
+
+jobs_router = APIRouter()
+
+
+@jobs_router.post("", response_model=JobCreatedResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_explanation_job(
+    method: str = Form(...),
+    file: UploadFile = File(...),
+    history_id: Optional[str] = Form(None),
+    db: AsyncDatabase = Depends(get_async_db),
+    user: Optional[dict] = Depends(get_current_user_optional)
+):
+    if method not in XAI_METHODS:
+        raise unsupported_xai_method_exception
+
+    image_data = await file.read()
+    model_version = await resolve_model_version(db, user, history_id, image_data)
+    job_id, access_token = await create_job(
+        db, method, image_data, file.filename, user=user, history_id=history_id, model_version=model_version
+    )
+    return JobCreatedResponse(job_id=job_id, status=JOB_QUEUED, access_token=access_token)
+
+
+@jobs_router.get("/{job_id}", response_model=JobStatusResponse)
+async def get_explanation_job(
+    job_id: str,
+    x_job_token: Optional[str] = Header(None),
+    db: AsyncDatabase = Depends(get_async_db),
+    user: Optional[dict] = Depends(get_current_user_optional)
+):
+    try:
+        object_id = ObjectId(job_id)
+    except Exception:
+        raise invalid_job_id_exception
+
+    job = await get_job(db, object_id, user=user, access_token=x_job_token)
+    return job_to_response(job)
+
+
+@jobs_router.get("/{job_id}/result", response_model=XAIResponse)
+async def get_explanation_job_result(
+    job_id: str,
+    x_job_token: Optional[str] = Header(None),
+    db: AsyncDatabase = Depends(get_async_db),
+    user: Optional[dict] = Depends(get_current_user_optional)
+):
+    try:
+        object_id = ObjectId(job_id)
+    except Exception:
+        raise invalid_job_id_exception
+
+    job = await get_job(db, object_id, user=user, access_token=x_job_token)
+    if job["status"] == JOB_FAILED:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=job["error"])
+    if job["status"] != JOB_DONE:
+        raise job_not_finished_exception
+    return job["result"]
@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import Optional
+from app.xai.schemas import XAIResponse
+
+
+class JobCreatedResponse(BaseModel):
+    job_id: str
+    status: str
+    access_token: Optional[str] = None  # anonymous jobs only, send it back as X-Job-Token
+
+
+class JobStatusResponse(BaseModel):
+    id: str
+    method: str
+    status: str
+    stage: str
+    progress: float
+    error: Optional[str] = None
+    result: Optional[XAIResponse] = None
+    created_at: str
+    updated_at: str
@@ -0,0 +1,218 @@
+import hashlib
+import hmac
+import secrets
+from bson import ObjectId
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException, status
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.asynchronous.database import AsyncDatabase
+from typing import Optional, Tuple
+
+from app.classification_models.model_loader import registry
+from app.db.repositories import ImageRepository
+from app.jobs.config import JOBS_LEASE_SECONDS, JOBS_RESULT_TTL_HOURS
+from app.jobs.models import Job, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED
+from app.jobs.schemas import JobStatusResponse
+from app.utils.exceptions import (
+    invalid_image_exception,
+    invalid_lime_image_exception,
+    job_not_found_exception,
+    user_history_not_found_exception,
+    user_not_found_exception
+)
+from app.utils.getters_services import get_user_by_id
+from app.xai.service import XAI_METHODS, build_xai_response, run_explanation
+
+
+async def ensure_job_indexes(db: AsyncDatabase):
+    await db.xai_jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+    await db.xai_jobs.create_index("expires_at", expireAfterSeconds=0)
+
+
+def hash_access_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+async def create_job(
+    db: AsyncDatabase, method: str, image_data: bytes, filename: str, user=None, history_id=None, model_version=None
+) -> Tuple[str, Optional[str]]:
+    # returns (job id, access token); the token is only needed for anonymous jobs, whose ids
+    # (timestamp + counter) could otherwise be enumerated
+    if user and not history_id:
+        raise user_history_not_found_exception
+
+    input_image_id = await ImageRepository(db).upload(image_data, f"job_input_{filename}")
+    access_token = None if user else secrets.token_urlsafe(32)
+
+    job = Job(
+        method=method,
+        input_image_id=str(input_image_id),
+        filename=filename,
+        user_id=str(user["_id"]) if user else None,
+        access_token_hash=hash_access_token(access_token) if access_token else None,
+        history_id=history_id,
+        model_version=model_version
+    )
+    inserted = await db.xai_jobs.insert_one(asdict(job))
+    return str(inserted.inserted_id), access_token
+
+
+async def get_job(db: AsyncDatabase, job_id: ObjectId, user=None, access_token: Optional[str] = None) -> dict:
+    job = await db.xai_jobs.find_one({"_id": job_id})
+    if not job:
+        raise job_not_found_exception
+
+    # jobs of signed-in users are only visible to their owner
+    if job.get("user_id"):
+        if not user or str(user["_id"]) != job["user_id"]:
+            raise job_not_found_exception
+        return job
+
+    # anonymous jobs only to whoever holds the token returned when it was created
+    expected = job.get("access_token_hash")
+    if not expected or not access_token or not hmac.compare_digest(expected, hash_access_token(access_token)):
+        raise job_not_found_exception
+    return job
+
+
+def job_to_response(job: dict) -> JobStatusResponse:
+    return JobStatusResponse(
+        id=str(job["_id"]),
+        method=job["method"],
+        status=job["status"],
+        stage=job["stage"],
+        progress=job["progress"],
+        error=job.get("error"),
+        result=job.get("result"),
+        created_at=job["created_at"].isoformat(),
+        updated_at=job["updated_at"].isoformat()
+    )
+
+
+# Every claim gets its own token. A worker only touches the job while the token still
+# matches, so a job that was requeued under it (lease expired) is never finished twice.
+def claimed(job: dict) -> dict:
+    return {"_id": job["_id"], "claim": job["claim"]}
+
+
+async def claim_next_job(db: AsyncDatabase):
+    now = datetime.now(timezone.utc)
+    return await db.xai_jobs.find_one_and_update(
+        {"status": JOB_QUEUED},
+        {"$set": {
+            "status": JOB_RUNNING,
+            "stage": "starting",
+            "progress": 0.05,
+            "claim": secrets.token_hex(16),
+            "updated_at": now,
+            "lease_expires_at": now + timedelta(seconds=JOBS_LEASE_SECONDS)
+        }},
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def renew_job_lease(db: AsyncDatabase, job: dict) -> bool:
+    now = datetime.now(timezone.utc)
+    updated = await db.xai_jobs.update_one(
+        {**claimed(job), "status": JOB_RUNNING},
+        {"$set": {"lease_expires_at": now + timedelta(seconds=JOBS_LEASE_SECONDS)}}
+    )
+    return updated.matched_count == 1
+
+
+async def release_job(db: AsyncDatabase, job: dict):
+    await db.xai_jobs.update_one(
+        {**claimed(job), "status": JOB_RUNNING},
+        {"$set": {
+            "status": JOB_QUEUED,
+            "stage": JOB_QUEUED,
+            "progress": 0.0,
+            "claim": None,
+            "updated_at": datetime.now(timezone.utc)
+        }}
+    )
+
+
+async def requeue_stale_jobs(db: AsyncDatabase):
+    # jobs whose worker died (restart, crash) go back to the queue
+    now = datetime.now(timezone.utc)
+    await db.xai_jobs.update_many(
+        {"status": JOB_RUNNING, "lease_expires_at": {"$lt": now}},
+        {"$set": {"status": JOB_QUEUED, "stage": JOB_QUEUED, "progress": 0.0, "claim": None, "updated_at": now}}
+    )
+
+
+async def update_job_progress(db: AsyncDatabase, job: dict, stage: str, progress: float):
+    now = datetime.now(timezone.utc)
+    await db.xai_jobs.update_one(
+        claimed(job),
+        {"$set": {
+            "stage": stage,
+            "progress": progress,
+            "updated_at": now,
+            "lease_expires_at": now + timedelta(seconds=JOBS_LEASE_SECONDS)
+        }}
+    )
+
+
+async def finish_job(db: AsyncDatabase, job: dict, result: dict = None, error: str = None):
+    now = datetime.now(timezone.utc)
+    updated = await db.xai_jobs.update_one(
+        claimed(job),
+        {"$set": {
+            "status": JOB_FAILED if error else JOB_DONE,
+            "stage": JOB_FAILED if error else JOB_DONE,
+            "progress": 1.0,
+            "result": result,
+            "error": error,
+            "updated_at": now,
+            "expires_at": now + timedelta(hours=JOBS_RESULT_TTL_HOURS)
+        }}
+    )
+    if updated.matched_count == 0:
+        # the lease was lost and the job belongs to another run now, which still needs the input
+        return
+
+    try:
+        await ImageRepository(db).delete(job["input_image_id"])
+    except Exception:
+        pass
+
+
+async def run_job(db: AsyncDatabase, job: dict):
+    method_name, _ = XAI_METHODS[job["method"]]
+
+    try:
+        await update_job_progress(db, job, "loading", 0.1)
+        image_data = await ImageRepository(db).download(job["input_image_id"])
+
+        model_version = job.get("model_version")
+        if not model_version or not registry.has(model_version):
+            # the version was rolled out while the job waited in the queue
+            model_version = registry.default().version
+
+        await update_job_progress(db, job, "explaining", 0.2)
+        result = await run_explanation(job["method"], image_data, model_version)
+        if result is None:
+            raise invalid_lime_image_exception if job["method"] == "lime" else invalid_image_exception
+
+        await update_job_progress(db, job, "saving", 0.9)
+        user = None
+        if job.get("user_id"):
+            user = await get_user_by_id(db, job["user_id"])
+            if not user:
+                raise user_not_found_exception
+
+        response = await build_xai_response(
+            db, user, method_name, result, job["filename"], job.get("history_id"), model_version
+        )
+        await finish_job(db, job, result=response.model_dump())
+    except HTTPException as e:
+        if e.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+            # the pool is saturated by interactive requests, the worker hands the job back
+            raise
+        await finish_job(db, job, error=e.detail)
+    except Exception as e:
+        await finish_job(db, job, error=str(e))
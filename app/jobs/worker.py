@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from fastapi import HTTPException
+from pymongo.asynchronous.database import AsyncDatabase
+
+from app.classification_models.config import MODEL_RELOAD_INTERVAL_SECONDS
+from app.classification_models.model_loader import registry
+from app.db.mongo import close_async_client, get_async_db
+from app.jobs.config import JOBS_CONCURRENCY, JOBS_LEASE_SECONDS, JOBS_MAX_BACKOFF_SECONDS, JOBS_POLL_INTERVAL_SECONDS
+from app.jobs.service import (
+    claim_next_job,
+    ensure_job_indexes,
+    release_job,
+    renew_job_lease,
+    requeue_stale_jobs,
+    run_job
+)
+from app.utils.workers import shutdown_executor
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorker:
+    def __init__(self, db: AsyncDatabase, concurrency: int = JOBS_CONCURRENCY, poll_interval: float = JOBS_POLL_INTERVAL_SECONDS):
+        self.db = db
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._tasks = []
+
+    async def start(self):
+        await ensure_job_indexes(self.db)
+        await requeue_stale_jobs(self.db)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        failures = 0
+        while True:
+            try:
+                await self._run_once()
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # e.g. Mongo briefly unreachable; the worker must outlive it
+                failures += 1
+                logger.exception("Job worker iteration failed")
+                await asyncio.sleep(min(self.poll_interval * 2 ** failures, JOBS_MAX_BACKOFF_SECONDS))
+
+    async def _run_once(self):
+        job = await claim_next_job(self.db)
+        if job is None:
+            await requeue_stale_jobs(self.db)
+            await asyncio.sleep(self.poll_interval)
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await run_job(self.db, job)
+        except HTTPException:
+            # the pool is saturated by interactive requests, hand the job back
+            await release_job(self.db, job)
+            await asyncio.sleep(self.poll_interval)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job: dict):
+        # keeps the lease alive while a long explanation runs, well before it expires
+        while True:
+            await asyncio.sleep(JOBS_LEASE_SECONDS / 3)
+            try:
+                if not await renew_job_lease(self.db, job):
+                    return
+            except Exception:
+                logger.exception("Could not renew the lease of job %s", job["_id"])
+
+
+async def main():
+    registry.load_in_background()
+    registry.start_watcher(MODEL_RELOAD_INTERVAL_SECONDS)
+    worker = JobWorker(await get_async_db())
+    await worker.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await worker.stop()
+        registry.stop_watcher()
+        shutdown_executor()
+        await close_async_client()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
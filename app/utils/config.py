@@ -6,4 +6,42 @@ load_dotenv()
 
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 120))
-REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
\ No newline at end of file
+REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+
+WORKER_POOL_KIND = os.getenv("WORKER_POOL_KIND", "thread")  # thread | process
+# minimum size of the pool for explanations; it grows to the sum of their method limits
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", 4))
+# methods served by a separate pool, sized by their limits (comma-separated)
+WORKER_LIGHT_METHODS = os.getenv("WORKER_LIGHT_METHODS", "classify")
+WORKER_QUEUE_LIMIT = int(os.getenv("WORKER_QUEUE_LIMIT", 8))
+WORKER_RETRY_AFTER_SECONDS = int(os.getenv("WORKER_RETRY_AFTER_SECONDS", 10))
+WORKER_METHOD_LIMITS = os.getenv("WORKER_METHOD_LIMITS", "classify=4,gradcam=2,ig=1,lime=1,shap=1,anchor=1")
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory | mongo
+CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", 256))
+CACHE_MEMORY_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_MONGO_MAX_BYTES = int(os.getenv("CACHE_MONGO_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", 24 * 60 * 60))
+
+IMAGE_CACHE_CONTROL = os.getenv("IMAGE_CACHE_CONTROL", "public, max-age=31536000, immutable")
+IMAGE_STREAM_CHUNK_SIZE = int(os.getenv("IMAGE_STREAM_CHUNK_SIZE", 255 * 1024))
+
+HISTORY_DELETE_BATCH_SIZE = int(os.getenv("HISTORY_DELETE_BATCH_SIZE", 1000))
+HISTORY_DELETE_BACKGROUND_THRESHOLD = int(os.getenv("HISTORY_DELETE_BACKGROUND_THRESHOLD", 50))
+
+HISTORY_PAGE_DEFAULT_LIMIT = int(os.getenv("HISTORY_PAGE_DEFAULT_LIMIT", 50))
+HISTORY_PAGE_MAX_LIMIT = int(os.getenv("HISTORY_PAGE_MAX_LIMIT", 200))
+
+HAIR_REMOVAL_METHOD = os.getenv("HAIR_REMOVAL_METHOD", "ns")  # ns | telea | none
+HAIR_INPAINT_RADIUS = int(os.getenv("HAIR_INPAINT_RADIUS", 1))
+# images whose hair mask covers less than this fraction of pixels are not inpainted;
+# 0 always inpaints, as before (e.g. 0.002 skips most hairless images, at slightly different outputs)
+HAIR_MASK_MIN_RATIO = float(os.getenv("HAIR_MASK_MIN_RATIO", 0))
+PREPROCESS_CACHE_MAX_ENTRIES = int(os.getenv("PREPROCESS_CACHE_MAX_ENTRIES", 512))
+PREPROCESS_CACHE_TTL_SECONDS = int(os.getenv("PREPROCESS_CACHE_TTL_SECONDS", 60 * 60))
+
+# display images of explanations (overlay, heatmap): webp | jpeg | png
+ARTIFACT_FORMAT = os.getenv("ARTIFACT_FORMAT", "webp")
+ARTIFACT_QUALITY = int(os.getenv("ARTIFACT_QUALITY", 85))
+# raw attribution map stored next to them for re-colouring: none | float16 (.npy) | uint8 (grayscale PNG + value range)
+ARTIFACT_RAW_MAP = os.getenv("ARTIFACT_RAW_MAP", "none")
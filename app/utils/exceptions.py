@@ -1,4 +1,5 @@
 from fastapi import HTTPException, status
+from app.utils.config import WORKER_RETRY_AFTER_SECONDS
 
 email_already_registered_exception = HTTPException(
     status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
@@ -53,4 +54,58 @@ invalid_lime_image_exception = HTTPException(
 
 invalid_image_exception = HTTPException(
     status_code=status.HTTP_400_BAD_REQUEST, detail="Explanation could not be generated."
-)
\ No newline at end of file
+)
+
+service_overloaded_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Server is busy, please retry later",
+    headers={"Retry-After": str(WORKER_RETRY_AFTER_SECONDS)}
+)
+
+
+invalid_job_id_exception = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid job ID"
+)
+
+job_not_found_exception = HTTPException(
+    status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+)
+
+unsupported_xai_method_exception = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported explanation method"
+)
+
+job_not_finished_exception = HTTPException(
+    status_code=status.HTTP_409_CONFLICT, detail="Job is not finished yet"
+)
+
+invalid_cursor_exception = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor"
+)
+
+invalid_history_fields_exception = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid history fields"
+)
+
+blob_not_found_exception = HTTPException(
+    status_code=status.HTTP_404_NOT_FOUND, detail="Blob not found or expired"
+)
+
+explanation_budget_exceeded_exception = HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    detail="Explanation did not finish within its time or sample budget, retry with a larger budget"
+)
+
+
+# raised in the workers (a plain exception, so it survives the process pool) and
+# turned into explanation_budget_exceeded_exception by the service
+class ExplanationBudgetExceeded(Exception):
+    pass
+
+
+def too_many_requests_exception(retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many attempts, please retry later",
+        headers={"Retry-After": str(retry_after)}
+    )
@@ -1,27 +1,157 @@
-
-from pymongo.database import Database
-from bson import ObjectId
-from io import BytesIO
-from fastapi.responses import StreamingResponse
+from pymongo import ASCENDING, DESCENDING
+from pymongo.asynchronous.database import AsyncDatabase
 from bson import ObjectId
-import gridfs
+from fastapi import HTTPException, status
+from fastapi.responses import Response, StreamingResponse
+from email.utils import format_datetime
+from datetime import timezone
+from typing import List, Optional
+import mimetypes
 
+from app.db.repositories import HistoryRepository, ImageRepository, UserRepository
+from app.utils.config import IMAGE_CACHE_CONTROL, IMAGE_STREAM_CHUNK_SIZE
 
-def get_user_by_email(db: Database, email: str):
-    return db.users.find_one({"email": email})
 
+async def get_user_by_email(db: AsyncDatabase, email: str):
+    return await UserRepository(db).get_by_email(email)
 
-def get_user_by_id(db: Database, id: str):
-    object_id = ObjectId(id)
-    return db.users.find_one({"_id": object_id})
+
+async def get_user_by_id(db: AsyncDatabase, id: str):
+    return await UserRepository(db).get_by_id(id)
 
 
-def get_histories_by_user_id(db: Database, id: str):
+HISTORY_FIELDS = ["image_id", "predicted_class", "confidence", "probabilities", "timestamp", "model_version"]
+
+
+async def get_histories_by_user_id(
+    db: AsyncDatabase,
+    id: str,
+    limit: Optional[int] = None,
+    after: Optional[tuple] = None,
+    ascending: bool = False,
+    fields: Optional[List[str]] = None,
+    predicted_classes: Optional[List[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+):
     object_id = ObjectId(id)
-    return db.histories.find({"user_id": object_id})
+    query = {"user_id": object_id}
+
+    if predicted_classes:
+        query["predicted_class"] = {"$in": predicted_classes}
+    if date_from or date_to:
+        query["timestamp"] = {}
+        if date_from:
+            query["timestamp"]["$gte"] = date_from
+        if date_to:
+            query["timestamp"]["$lte"] = date_to
+
+    # keyset pagination on (timestamp, _id), served by the (user_id, timestamp, _id) index
+    if after:
+        timestamp, last_id = after
+        op = "$gt" if ascending else "$lt"
+        query["$and"] = [{"$or": [
+            {"timestamp": {op: timestamp}},
+            {"timestamp": timestamp, "_id": {op: last_id}}
+        ]}]
+
+    projection = None
+    if fields is not None:
+        projection = {field: 1 for field in fields}
+        projection["timestamp"] = 1
+
+    direction = ASCENDING if ascending else DESCENDING
+    sort = [("timestamp", direction), ("_id", direction)]
+    return await HistoryRepository(db).find(query, projection, sort=sort, limit=limit or 0)
+
+
+def guess_image_type(grid_out, head: bytes) -> str:
+    content_type = (grid_out.metadata or {}).get("contentType") or grid_out.content_type
+    if content_type:
+        return content_type
+    # older uploads were stored without a content type
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return mimetypes.guess_type(grid_out.filename or "")[0] or "application/octet-stream"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+
+def parse_range(range_header: Optional[str], length: int):
+    # Only a single "bytes=start-end" range is supported; anything else serves the full file
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+
+    start, _, end = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            start = int(start)
+            end = min(int(end), length - 1) if end else length - 1
+        else:
+            suffix = int(end)
+            start, end = max(length - suffix, 0), length - 1
+    except ValueError:
+        return None
+
+    if start >= length or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{length}"}
+        )
+    return start, end
+
+
+async def iter_gridfs(grid_out, start: int, length: int):
+    await grid_out.seek(start)
+    remaining = length
+    while remaining > 0:
+        chunk = await grid_out.read(min(IMAGE_STREAM_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+async def get_image_from_gridfs(db: AsyncDatabase, image_id, if_none_match: Optional[str] = None, range_header: Optional[str] = None):
+    grid_out = await ImageRepository(db).open(image_id)
+
+    # GridFS files are never rewritten in place, so the id is a strong validator
+    etag = f'"{getattr(grid_out, "md5", None) or image_id}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Last-Modified": format_datetime(grid_out.upload_date.replace(tzinfo=timezone.utc), usegmt=True)
+    }
+
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    media_type = guess_image_type(grid_out, await grid_out.read(12))
+    length = grid_out.length
+    byte_range = parse_range(range_header, length)
 
+    if byte_range is None:
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(iter_gridfs(grid_out, 0, length), media_type=media_type, headers=headers)
 
-def get_image_from_gridfs(db, image_id):
-    fs = gridfs.GridFS(db)
-    file_data = fs.get(ObjectId(image_id)).read()
-    return StreamingResponse(BytesIO(file_data), media_type="image/jpeg")
\ No newline at end of file
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_gridfs(grid_out, start, end - start + 1),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=media_type,
+        headers=headers
+    )
@@ -1,33 +1,66 @@
-from gridfs import GridFS
 from bson import ObjectId
-from pymongo.database import Database
-from app.utils.exceptions import invalid_image_id_exception
+from pymongo.asynchronous.database import AsyncDatabase
+from app.db.repositories import ExplanationRepository, HistoryRepository, ImageRepository
+from app.utils.config import HISTORY_DELETE_BATCH_SIZE
 
-def delete_history_with_related(db: Database, history_id: ObjectId):
-    explanations = list(db.explanations.find({"history_id": history_id}))
-    fs = GridFS(db)
+async def collect_related_ids(db: AsyncDatabase, history_filter: dict):
+    # One aggregation over histories + explanations yields every history id and
+    # every GridFS file they reference (original upload, overlays, heatmaps and attribution maps).
+    pipeline = [
+        {"$match": history_filter},
+        {"$lookup": {
+            "from": "explanations",
+            "localField": "_id",
+            "foreignField": "history_id",
+            "as": "explanation"
+        }},
+        {"$unwind": {"path": "$explanation", "preserveNullAndEmptyArrays": True}},
+        {"$unwind": {"path": "$explanation.explanations", "preserveNullAndEmptyArrays": True}},
+        {"$project": {
+            "file_ids": [
+                "$image_id",
+                "$explanation.explanations.overlay_image_id",
+                "$explanation.explanations.heatmap_image_id",
+                "$explanation.explanations.attribution_map_id"
+            ]
+        }},
+        {"$unwind": "$file_ids"},
+        {"$group": {
+            "_id": None,
+            "history_ids": {"$addToSet": "$_id"},
+            "file_ids": {"$addToSet": "$file_ids"}
+        }}
+    ]
+    results = await HistoryRepository(db).aggregate(pipeline)
+    if not results:
+        return [], []
+    result = results[0]
 
-    for explanation in explanations:
-        for item in explanation.get("explanations", []):
-            image_id = item.get("overlay_image_id")
-            if image_id:
-                try:
-                    fs.delete(ObjectId(image_id))
-                except Exception:
-                    raise invalid_image_id_exception
+    file_ids = [ObjectId(file_id) for file_id in result["file_ids"] if file_id and ObjectId.is_valid(file_id)]
+    return result["history_ids"], file_ids
 
-        db.explanations.delete_one({"_id": explanation["_id"]})
 
-    db.histories.delete_one({"_id": history_id})
+async def delete_many_in_batches(delete_many, ids: list):
+    deleted = 0
+    for start in range(0, len(ids), HISTORY_DELETE_BATCH_SIZE):
+        deleted += await delete_many(ids[start:start + HISTORY_DELETE_BATCH_SIZE])
+    return deleted
 
 
-def delete_all_images(db: Database):
-    fs = GridFS(db)
+async def delete_histories_with_related(db: AsyncDatabase, history_filter: dict) -> dict:
+    history_ids, file_ids = await collect_related_ids(db, history_filter)
 
-    files = fs.find()
+    # files go first: if we stop halfway, the histories still point at what is left
+    deleted_files = await delete_many_in_batches(ImageRepository(db).delete_many, file_ids)
+    await delete_many_in_batches(ExplanationRepository(db).delete_many, history_ids)
+    deleted_histories = await delete_many_in_batches(HistoryRepository(db).delete_many, history_ids)
 
-    for file in files:
-        try:
-            fs.delete(file._id)
-        except Exception as e:
-            raise invalid_image_id_exception 
\ No newline at end of file
+    return {"histories": deleted_histories, "images": deleted_files}
+
+
+async def delete_history_with_related(db: AsyncDatabase, history_id: ObjectId):
+    return await delete_histories_with_related(db, {"_id": history_id})
+
+
+async def delete_all_images(db: AsyncDatabase):
+    await ImageRepository(db).delete_all()
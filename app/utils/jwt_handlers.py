@@ -1,25 +1,33 @@
 from datetime import datetime, timedelta, timezone
+from uuid import uuid4
 import jwt
 
 from app.utils.config import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, REFRESH_TOKEN_EXPIRE_DAYS
 from app.config import SECRET_KEY
 
-def create_access_token(data: dict, expires_delta: timedelta = None):
+# Tokens carry everything needed to authenticate a request: the user ("sub"), the login
+# session ("sid", shared by the access and refresh token and used for revocation), the
+# token type and a unique "jti". Nothing about tokens is stored on the user document.
+
+def new_session_id() -> str:
+    return uuid4().hex
+
+def create_token(data: dict, token_type: str, expires_delta: timedelta) -> str:
     to_encode = data.copy()
-    expire_time = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     now = datetime.now(timezone.utc)
-    expire = now + (expires_delta or expire_time)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": now + expires_delta, "iat": now, "type": token_type, "jti": uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_access_token(data: dict, expires_delta: timedelta = None):
+    return create_token(data, "access", expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
 def create_refresh_token(data: dict) -> str:
-    to_encode = data.copy()
-    now = datetime.now(timezone.utc)
-    expire = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    return create_token(data, "refresh", timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+
+def session_expires_at() -> datetime:
+    # no token of a session issued now outlives this
+    return datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
 
 def decode_access_token(token: str):
     try:
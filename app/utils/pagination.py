@@ -0,0 +1,17 @@
+import base64
+import json
+from bson import ObjectId
+from app.utils.exceptions import invalid_cursor_exception
+
+
+def encode_cursor(timestamp: str, object_id: ObjectId) -> str:
+    raw = json.dumps({"t": timestamp, "id": str(object_id)}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return data["t"], ObjectId(data["id"])
+    except Exception:
+        raise invalid_cursor_exception
@@ -2,25 +2,81 @@ import numpy as np
 import cv2
 from PIL import Image
 import io
+from typing import Tuple
 
-def clean_skin_image(image_np: np.ndarray) -> np.ndarray:
+from app.utils.config import (
+    HAIR_INPAINT_RADIUS,
+    HAIR_MASK_MIN_RATIO,
+    HAIR_REMOVAL_METHOD,
+    PREPROCESS_CACHE_MAX_ENTRIES,
+    PREPROCESS_CACHE_TTL_SECONDS
+)
+from app.utils.result_cache import MemoryCache, content_hash
+
+MODEL_INPUT_SIZE = (224, 224)
+
+INPAINT_FLAGS = {
+    "ns": cv2.INPAINT_NS,
+    "telea": cv2.INPAINT_TELEA,
+}
+
+# cleaned 224x224 images by upload hash, shared by classification and every XAI method
+cleaned_images = MemoryCache(
+    max_entries=PREPROCESS_CACHE_MAX_ENTRIES,
+    max_bytes=PREPROCESS_CACHE_MAX_ENTRIES * MODEL_INPUT_SIZE[0] * MODEL_INPUT_SIZE[1] * 3,
+    ttl_seconds=PREPROCESS_CACHE_TTL_SECONDS
+)
+
+
+def hair_mask(image_np: np.ndarray) -> np.ndarray:
     gray = cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY)
     kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
     blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, kernel)
     _, binary_mask = cv2.threshold(blackhat, 15, 255, cv2.THRESH_BINARY)
-    binary_mask = cv2.dilate(binary_mask, np.ones((2, 2), np.uint8), iterations=1)
-    clean_image = cv2.inpaint(image_np, binary_mask, inpaintRadius=1, flags=cv2.INPAINT_NS)
+    return cv2.dilate(binary_mask, np.ones((2, 2), np.uint8), iterations=1)
+
+
+def clean_skin_image(
+    image_np: np.ndarray,
+    method: str = HAIR_REMOVAL_METHOD,
+    min_mask_ratio: float = HAIR_MASK_MIN_RATIO
+) -> np.ndarray:
+    if method == "none":
+        return image_np
+
+    binary_mask = hair_mask(image_np)
+    # inpainting is the expensive part; skip it when there is (almost) no hair to remove
+    if cv2.countNonZero(binary_mask) < min_mask_ratio * binary_mask.size:
+        return image_np
+
+    clean_image = cv2.inpaint(image_np, binary_mask, inpaintRadius=HAIR_INPAINT_RADIUS, flags=INPAINT_FLAGS[method])
     return clean_image
 
 
+def image_content_type(image_bytes: bytes) -> str:
+    # reads the header only, no pixel decoding
+    image = Image.open(io.BytesIO(image_bytes))
+    return Image.MIME.get(image.format, "application/octet-stream")
+
+
+def decode_image(image_bytes: bytes, size: Tuple[int, int] = MODEL_INPUT_SIZE) -> np.ndarray:
+    image = Image.open(io.BytesIO(image_bytes))
+    # JPEG only: the decoder scales by 1/2..1/8 in the DCT domain, never below `size`,
+    # so a 12 MP phone photo is never fully decoded just to be resized to 224x224
+    image.draft("RGB", size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image = image.resize(size)
+    return np.asarray(image)
+
+
 def load_and_preprocess_image(image_bytes: bytes) -> np.ndarray:
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    image = image.resize((224, 224))
-    image_np = np.array(image)
-    image_np = clean_skin_image(image_np)
-    return image_np
-
-def load_and_image(image_bytes: bytes) -> np.ndarray:
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    image_np = np.array(image)
-    return image_np
\ No newline at end of file
+    key = content_hash(image_bytes)
+    cached = cleaned_images.get(key)
+    if cached is not None:
+        # callers get their own copy, the cached one stays untouched
+        return cached["image"].copy()
+
+    image_np = clean_skin_image(decode_image(image_bytes))
+    cleaned_images.set(key, {"image": image_np})
+    return image_np.copy()
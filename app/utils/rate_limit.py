@@ -0,0 +1,38 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+# Token buckets per key (client IP, account email, ...) kept in process memory.
+# Least recently used keys are dropped past max_keys; a dropped key simply starts
+# again with a full bucket.
+class MemoryRateLimiter:
+    def __init__(self, capacity: int, rate: float, max_keys: int):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, cost: float = 1.0) -> int:
+        # takes `cost` tokens; returns 0 if allowed, else the seconds until it would be
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(self.capacity), now))
+            tokens = min(float(self.capacity), tokens + (now - updated) * self.rate)
+
+            retry_after = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                retry_after = max(1, math.ceil((cost - tokens) / self.rate)) if self.rate > 0 else 3600
+
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+    def reset(self, key: str):
+        with self._lock:
+            self._buckets.pop(key, None)
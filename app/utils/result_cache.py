@@ -0,0 +1,194 @@
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from bson import Binary
+from pymongo import ASCENDING, DESCENDING
+from pymongo.database import Database
+
+from app.db.mongo import get_mongo_db
+from app.utils.config import (
+    CACHE_BACKEND,
+    CACHE_MEMORY_MAX_BYTES,
+    CACHE_MEMORY_MAX_ENTRIES,
+    CACHE_MONGO_MAX_BYTES,
+    CACHE_TTL_SECONDS,
+    HAIR_INPAINT_RADIUS,
+    HAIR_MASK_MIN_RATIO,
+    HAIR_REMOVAL_METHOD
+)
+
+EVICTION_CHECK_EVERY = 16
+
+# hair removal changes the model input, so results computed under other settings never match
+PREPROCESS_SIGNATURE = f"hair={HAIR_REMOVAL_METHOD},min_ratio={HAIR_MASK_MIN_RATIO},radius={HAIR_INPAINT_RADIUS}"
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(image_data: bytes, kind: str, model_version: str, **params) -> str:
+    params_key = json.dumps(params, sort_keys=True, default=str)
+    raw_key = f"{content_hash(image_data)}|{kind}|{model_version}|{PREPROCESS_SIGNATURE}|{params_key}"
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+def value_size(value: dict) -> int:
+    size = 0
+    for item in value.values():
+        if isinstance(item, np.ndarray):
+            size += item.nbytes
+        elif isinstance(item, (bytes, bytearray)):
+            size += len(item)
+        else:
+            size += 64
+    return size
+
+
+def encode_value(value: dict) -> dict:
+    arrays = {k: v for k, v in value.items() if isinstance(v, np.ndarray)}
+    fields = {k: v for k, v in value.items() if not isinstance(v, np.ndarray)}
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return {"fields": fields, "arrays": Binary(buffer.getvalue())}
+
+
+def decode_value(doc: dict) -> dict:
+    with np.load(io.BytesIO(doc["arrays"])) as data:
+        arrays = {k: data[k] for k in data.files}
+    return {**doc["fields"], **arrays}
+
+
+class MemoryCache:
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict):
+        size = value_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl_seconds)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+
+class MongoCache:
+    def __init__(self, db: Database, max_bytes: int, ttl_seconds: int):
+        self.collection = db.result_cache
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._writes = 0
+        self._indexes_ready = False
+
+    def get(self, key: str):
+        self._ensure_indexes()
+        doc = self.collection.find_one({"_id": key})
+        if doc is None or doc["expires_at"].replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
+            return None
+        return decode_value(doc)
+
+    def set(self, key: str, value: dict):
+        self._ensure_indexes()
+        doc = encode_value(value)
+        now = datetime.now(timezone.utc)
+        doc.update({
+            "size": len(doc["arrays"]),
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl_seconds)
+        })
+        self.collection.replace_one({"_id": key}, doc, upsert=True)
+
+        self._writes += 1
+        if self._writes % EVICTION_CHECK_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        # Drop the oldest entries once the collection grows past its byte budget
+        total = next(self.collection.aggregate([{"$group": {"_id": None, "size": {"$sum": "$size"}}}]), None)
+        excess = (total["size"] if total else 0) - self.max_bytes
+        if excess <= 0:
+            return
+
+        stale_ids = []
+        for doc in self.collection.find({}, {"size": 1}).sort("created_at", ASCENDING):
+            stale_ids.append(doc["_id"])
+            excess -= doc["size"]
+            if excess <= 0:
+                break
+        self.collection.delete_many({"_id": {"$in": stale_ids}})
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+        self.collection.create_index([("created_at", DESCENDING)])
+        self._indexes_ready = True
+
+
+class ResultCache:
+    def __init__(self, memory: MemoryCache, persistent: MongoCache = None):
+        self.memory = memory
+        self.persistent = persistent
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = self.persistent.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: dict):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            self.persistent.set(key, value)
+
+    def get_or_compute(self, key: str, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+
+result_cache = ResultCache(
+    MemoryCache(CACHE_MEMORY_MAX_ENTRIES, CACHE_MEMORY_MAX_BYTES, CACHE_TTL_SECONDS),
+    MongoCache(get_mongo_db(), CACHE_MONGO_MAX_BYTES, CACHE_TTL_SECONDS) if CACHE_BACKEND == "mongo" else None
+)
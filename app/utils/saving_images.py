@@ -1,15 +1,57 @@
+import io
 import numpy as np
 import cv2
-import base64
-import gridfs
+from typing import Optional, Tuple
+from pymongo.asynchronous.database import AsyncDatabase
+from app.db.repositories import ImageRepository
+from app.utils.config import ARTIFACT_FORMAT, ARTIFACT_QUALITY, ARTIFACT_RAW_MAP
 
-def save_image_to_gridfs(db, image, filename):
-    fs = gridfs.GridFS(db)
-    _, buffer = cv2.imencode(".png", image)
-    file_id = fs.put(buffer.tobytes(), filename=filename)
-    return str(file_id)
+IMAGE_CODECS = {
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "png": (".png", "image/png", None),
+}
 
 
-def encode_image_to_base64(image: np.ndarray) -> str:
-    _, buffer = cv2.imencode(".png", image)
-    return base64.b64encode(buffer).decode("utf-8")
+def artifact_content_type(image_format: str = ARTIFACT_FORMAT) -> str:
+    return IMAGE_CODECS[image_format][1]
+
+
+def encode_image(image: np.ndarray, image_format: str = ARTIFACT_FORMAT, quality: int = ARTIFACT_QUALITY) -> Tuple[bytes, str]:
+    extension, content_type, quality_flag = IMAGE_CODECS[image_format]
+    params = [quality_flag, quality] if quality_flag is not None else []
+    _, buffer = cv2.imencode(extension, image, params)
+    return buffer.tobytes(), content_type
+
+
+def encode_attribution_map(attribution: np.ndarray, kind: str = ARTIFACT_RAW_MAP) -> Optional[Tuple[bytes, str, Optional[list]]]:
+    # (data, content type, [min, max] to map uint8 codes back to values)
+    if kind == "none" or attribution is None:
+        return None
+
+    attribution = np.asarray(attribution, dtype=np.float32)
+    if kind == "float16":
+        buffer = io.BytesIO()
+        np.save(buffer, attribution.astype(np.float16))
+        return buffer.getvalue(), "application/x-npy", None
+
+    low, high = float(attribution.min()), float(attribution.max())
+    scale = (high - low) or 1.0
+    codes = np.rint((attribution - low) * (255.0 / scale)).astype(np.uint8)
+    _, buffer = cv2.imencode(".png", codes)
+    return buffer.tobytes(), "image/png", [low, high]
+
+
+async def save_image_to_gridfs(db: AsyncDatabase, image, filename):
+    data, content_type = encode_image(image)
+    return await ImageRepository(db).upload(data, filename, content_type=content_type)
+
+
+async def save_attribution_map_to_gridfs(db: AsyncDatabase, attribution, filename):
+    encoded = encode_attribution_map(attribution)
+    if encoded is None:
+        return None, None, None
+    data, content_type, value_range = encoded
+    metadata = {"valueRange": value_range} if value_range else None
+    file_id = await ImageRepository(db).upload(data, filename, content_type=content_type, metadata=metadata)
+    return file_id, content_type, value_range
@@ -0,0 +1,112 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict
+
+from app.utils.config import (
+    WORKER_LIGHT_METHODS,
+    WORKER_METHOD_LIMITS,
+    WORKER_POOL_KIND,
+    WORKER_POOL_SIZE,
+    WORKER_QUEUE_LIMIT
+)
+from app.utils.exceptions import service_overloaded_exception
+
+DEFAULT_METHOD_LIMIT = 1
+
+_executors: Dict[str, Executor] = {}
+_executor_lock = threading.Lock()
+_limiters = {}
+
+
+def parse_method_limits(value: str) -> dict:
+    limits = {}
+    for part in value.split(","):
+        if "=" not in part:
+            continue
+        method, limit = part.split("=", 1)
+        limits[method.strip()] = max(int(limit), 1)
+    return limits
+
+
+METHOD_LIMITS = parse_method_limits(WORKER_METHOD_LIMITS)
+LIGHT_METHODS = {method.strip() for method in WORKER_LIGHT_METHODS.split(",") if method.strip()}
+
+
+class MethodLimiter:
+    def __init__(self, limit: int, queue_limit: int):
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.semaphore = asyncio.Semaphore(limit)
+
+    @property
+    def saturated(self) -> bool:
+        return self.pending >= self.limit + self.queue_limit
+
+
+def pool_name(method: str) -> str:
+    return "light" if method in LIGHT_METHODS else "heavy"
+
+
+def pool_size(pool: str) -> int:
+    # Light methods (classification) get a pool of their own, so they never queue behind a
+    # long explanation. The heavy pool fits every method's limit at once; the per-method
+    # semaphores bound the work, the pool size only has to avoid head-of-line blocking.
+    limits = [METHOD_LIMITS.get(method, DEFAULT_METHOD_LIMIT) for method in METHOD_LIMITS if pool_name(method) == pool]
+    if pool == "light":
+        return max(sum(limits), 1)
+    return max(WORKER_POOL_SIZE, sum(limits))
+
+
+def get_executor(method: str = "") -> Executor:
+    pool = pool_name(method)
+    executor = _executors.get(pool)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(pool)
+            if executor is None:
+                if WORKER_POOL_KIND == "process":
+                    # spawn: TensorFlow state does not survive a fork
+                    executor = ProcessPoolExecutor(
+                        max_workers=pool_size(pool),
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    executor = ThreadPoolExecutor(
+                        max_workers=pool_size(pool),
+                        thread_name_prefix=f"xai-{pool}-worker"
+                    )
+                _executors[pool] = executor
+    return executor
+
+
+def shutdown_executor():
+    with _executor_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+
+
+def get_limiter(method: str) -> MethodLimiter:
+    limiter = _limiters.get(method)
+    if limiter is None:
+        limit = METHOD_LIMITS.get(method, DEFAULT_METHOD_LIMIT)
+        limiter = _limiters.setdefault(method, MethodLimiter(limit, WORKER_QUEUE_LIMIT))
+    return limiter
+
+
+async def run_in_worker(method: str, fn, *args, **kwargs):
+    limiter = get_limiter(method)
+    if limiter.saturated:
+        raise service_overloaded_exception
+
+    limiter.pending += 1
+    try:
+        async with limiter.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_executor(method), functools.partial(fn, *args, **kwargs))
+    finally:
+        limiter.pending -= 1
@@ -0,0 +1,36 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IG_BATCH_SIZE = int(os.getenv("IG_BATCH_SIZE", 32))
+IG_USE_TF_FUNCTION = os.getenv("IG_USE_TF_FUNCTION", "true").lower() == "true"
+
+LIME_NUM_SAMPLES = int(os.getenv("LIME_NUM_SAMPLES", 300))
+LIME_BATCH_SIZE = int(os.getenv("LIME_BATCH_SIZE", 32))
+# early stopping: after LIME_MIN_SAMPLES, stop once the surrogate weights of the predicted
+# class change by less than LIME_EARLY_STOP_TOL (relative L2) for LIME_EARLY_STOP_PATIENCE batches;
+# the earliest stop is MIN_SAMPLES + PATIENCE * BATCH_SIZE (128 of the 300 samples by default)
+LIME_MIN_SAMPLES = int(os.getenv("LIME_MIN_SAMPLES", 64))
+LIME_EARLY_STOP_TOL = float(os.getenv("LIME_EARLY_STOP_TOL", 0.02))
+LIME_EARLY_STOP_PATIENCE = int(os.getenv("LIME_EARLY_STOP_PATIENCE", 2))
+
+SEGMENTS_CACHE_MAX_ENTRIES = int(os.getenv("SEGMENTS_CACHE_MAX_ENTRIES", 256))
+SEGMENTS_CACHE_TTL_SECONDS = int(os.getenv("SEGMENTS_CACHE_TTL_SECONDS", 60 * 60))
+
+SHAP_MAX_EVALS = int(os.getenv("SHAP_MAX_EVALS", 200))
+SHAP_MIN_EVALS = int(os.getenv("SHAP_MIN_EVALS", 40))
+SHAP_BATCH_SIZE = int(os.getenv("SHAP_BATCH_SIZE", 50))
+
+ANCHOR_THRESHOLD = float(os.getenv("ANCHOR_THRESHOLD", 0.95))
+ANCHOR_BATCH_SIZE = int(os.getenv("ANCHOR_BATCH_SIZE", 100))
+# the beam search is stopped once either budget is spent and the best anchor found so far is returned
+ANCHOR_TIME_BUDGET_MS = int(os.getenv("ANCHOR_TIME_BUDGET_MS", 15000))
+ANCHOR_MAX_SAMPLES = int(os.getenv("ANCHOR_MAX_SAMPLES", 5000))
+
+# anonymous results sent as blob URLs (Accept: application/vnd.xai.blob-urls+json) are kept in
+# process memory; behind several workers the follow-up GETs need sticky routing
+XAI_BLOB_TTL_SECONDS = int(os.getenv("XAI_BLOB_TTL_SECONDS", 300))
+XAI_BLOB_MAX_ENTRIES = int(os.getenv("XAI_BLOB_MAX_ENTRIES", 10000))
+XAI_BLOB_MAX_BYTES = int(os.getenv("XAI_BLOB_MAX_BYTES", 256 * 1024 * 1024))
+XAI_BLOB_URL_PREFIX = os.getenv("XAI_BLOB_URL_PREFIX", "/api/xai/blobs")
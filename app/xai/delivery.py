@@ -0,0 +1,83 @@
+import base64
+import secrets
+from typing import List, Optional, Tuple
+
+from fastapi import Response
+
+from app.utils.result_cache import MemoryCache
+from app.xai.config import XAI_BLOB_MAX_BYTES, XAI_BLOB_MAX_ENTRIES, XAI_BLOB_TTL_SECONDS, XAI_BLOB_URL_PREFIX
+
+# How anonymous callers receive their images, chosen by the Accept header:
+#   application/json (default)            base64 strings inside XAIResponse
+#   multipart/mixed                       XAIResponse as the first part, "cid:<name>" references
+#                                         to the raw image parts that follow
+#   application/vnd.xai.blob-urls+json    XAIResponse with short-lived URLs to raw bytes
+MULTIPART_MEDIA_TYPE = "multipart/mixed"
+BLOB_URLS_MEDIA_TYPE = "application/vnd.xai.blob-urls+json"
+
+blob_store = MemoryCache(
+    max_entries=XAI_BLOB_MAX_ENTRIES,
+    max_bytes=XAI_BLOB_MAX_BYTES,
+    ttl_seconds=XAI_BLOB_TTL_SECONDS
+)
+
+
+def response_mode(accept: Optional[str]) -> str:
+    media_types = [part.split(";")[0].strip().lower() for part in (accept or "").split(",")]
+    if MULTIPART_MEDIA_TYPE in media_types:
+        return "multipart"
+    if BLOB_URLS_MEDIA_TYPE in media_types:
+        return "urls"
+    return "json"
+
+
+def base64_reference(name: str, data: bytes, content_type: str) -> str:
+    return base64.b64encode(data).decode("utf-8")
+
+
+# Collects the raw artifacts of one response and hands out the references that go
+# into the explanation items in their place.
+class Attachments:
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.parts: List[Tuple[str, bytes, str]] = []
+
+    def add(self, name: str, data: bytes, content_type: str) -> str:
+        if self.mode == "multipart":
+            self.parts.append((name, data, content_type))
+            return f"cid:{name}"
+
+        blob_id = secrets.token_urlsafe(18)
+        blob_store.set(blob_id, {"data": data, "content_type": content_type})
+        return f"{XAI_BLOB_URL_PREFIX}/{blob_id}"
+
+    def response(self, payload) -> Response:
+        if self.mode != "multipart":
+            return payload
+
+        boundary = secrets.token_hex(16)
+        chunks = [part_bytes(boundary, "response", payload.model_dump_json().encode("utf-8"), "application/json")]
+        chunks += [part_bytes(boundary, name, data, content_type) for name, data, content_type in self.parts]
+        chunks.append(f"--{boundary}--\r\n".encode("ascii"))
+        return Response(content=b"".join(chunks), media_type=f'{MULTIPART_MEDIA_TYPE}; boundary="{boundary}"')
+
+
+def part_bytes(boundary: str, name: str, data: bytes, content_type: str) -> bytes:
+    headers = (
+        f"--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-ID: <{name}>\r\n"
+        f"Content-Length: {len(data)}\r\n\r\n"
+    )
+    return headers.encode("ascii") + data + b"\r\n"
+
+
+def attachments_for(user, mode: str) -> Optional[Attachments]:
+    # signed-in users get GridFS ids, which are already small
+    if user or mode == "json":
+        return None
+    return Attachments(mode)
+
+
+def get_blob(blob_id: str) -> Optional[dict]:
+    return blob_store.get(blob_id)
@@ -1,16 +1,180 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
 import numpy as np
 from alibi.explainers import AnchorImage
 
-def generate_anchor_for_image(image, model, threshold=0.95, p_sample=.5, n_segments=11): # 15
-    predict_fn = lambda x: model.predict(x)
-    
-    image_batch = np.expand_dims(image, axis=0)
-    preds = predict_fn(image_batch)
+from app.classification_models.model_loader import model_engine
+from app.utils.exceptions import ExplanationBudgetExceeded
+from app.xai.config import ANCHOR_BATCH_SIZE, ANCHOR_MAX_SAMPLES, ANCHOR_THRESHOLD, ANCHOR_TIME_BUDGET_MS
+from app.xai.methods.segmentation import get_segments
+
+SLIC_PARAMS = {"n_segments": 11, "compactness": 20, "sigma": .5} # 15
+
+
+class BudgetExceeded(ExplanationBudgetExceeded):
+    pass
+
+
+# Predictor handed to AnchorImage: one predict_on_batch call per chunk (no keras progress
+# bars, no per-call batching overhead) and a sample/time budget that aborts the search.
+class BudgetedPredictor:
+    def __init__(self, model, batch_size=ANCHOR_BATCH_SIZE):
+        self.model = model
+        self.batch_size = batch_size
+        self.samples = 0
+        self.deadline = None
+        self.max_samples = None
+
+    def reset(self):
+        self.samples = 0
+        self.deadline = None
+        self.max_samples = None
+
+    def arm(self, deadline, max_samples):
+        self.deadline = deadline
+        self.max_samples = max_samples
+
+    def exhausted(self) -> bool:
+        return (
+            (self.deadline is not None and time.monotonic() >= self.deadline)
+            or (self.max_samples is not None and self.samples >= self.max_samples)
+        )
+
+    def __call__(self, images):
+        if self.exhausted():
+            raise BudgetExceeded()
+        self.samples += len(images)
+        images = np.asarray(images, dtype=np.float32)
+        return np.concatenate([
+            np.asarray(self.model.predict_on_batch(images[start:start + self.batch_size]))
+            for start in range(0, len(images), self.batch_size)
+        ])
+
+
+# Keeps AnchorImage explainers per (model, input shape); building one runs a model call to
+# inspect the output. Explainers keep per-call state, so concurrent calls check out their own.
+# The SLIC segmentation goes through the shared segments cache.
+class AnchorEngine:
+    def __init__(self, model, input_shape, batch_size=ANCHOR_BATCH_SIZE):
+        self.model = model
+        self.input_shape = tuple(input_shape)
+        self.batch_size = batch_size
+        self.segmentation_fn = partial(get_segments, algorithm="slic", **SLIC_PARAMS)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _create_explainer(self):
+        predictor = BudgetedPredictor(self.model, self.batch_size)
+        explainer = AnchorImage(predictor, self.input_shape, segmentation_fn=self.segmentation_fn)
+        return explainer, predictor
+
+    @contextmanager
+    def explainer(self):
+        with self._lock:
+            pair = self._idle.pop() if self._idle else None
+        if pair is None:
+            pair = self._create_explainer()
+        try:
+            pair[1].reset()
+            yield pair
+        finally:
+            with self._lock:
+                self._idle.append(pair)
+
+    # Budgeted search. The budget is armed before the first beam search, so nothing runs
+    # past time_budget_ms / max_samples. A cheap single-segment pass runs first and is often
+    # enough on its own; otherwise the unbounded search follows, and if the budget cuts it
+    # off, the single-segment anchor is the best one found so far.
+    def explain(
+        self,
+        image,
+        threshold=ANCHOR_THRESHOLD,
+        p_sample=.5,
+        tau=0.25,
+        time_budget_ms=ANCHOR_TIME_BUDGET_MS,
+        max_samples=ANCHOR_MAX_SAMPLES
+    ):
+        started = time.monotonic()
+        best = None
+        passes = 0
+        budget_exhausted = False
+
+        with self.explainer() as (explainer, predictor):
+            predictor.arm(started + time_budget_ms / 1000.0, max_samples)
+            for max_anchor_size in (1, None):
+                try:
+                    explanation = explainer.explain(
+                        image,
+                        threshold=threshold,
+                        p_sample=p_sample,
+                        tau=tau,
+                        batch_size=self.batch_size,
+                        max_anchor_size=max_anchor_size
+                    )
+                except BudgetExceeded:
+                    budget_exhausted = True
+                    break
+                passes += 1
+
+                if best is None or anchor_score(explanation, threshold) > anchor_score(best, threshold):
+                    best = explanation
+                if float(best.precision) >= threshold:
+                    break
+
+            samples = predictor.samples
+
+        if best is None:
+            raise ExplanationBudgetExceeded(
+                f"Anchor search did not finish within {time_budget_ms} ms / {max_samples} samples"
+            )
+
+        metrics = {
+            "precision": float(best.precision),
+            "coverage": float(best.coverage),
+            "anchor_size": len(best.raw["feature"]),
+            "threshold_reached": float(best.precision) >= threshold,
+            "samples": int(samples),
+            "passes": passes,
+            "budget_exhausted": budget_exhausted,
+            "elapsed_ms": round((time.monotonic() - started) * 1000.0, 1)
+        }
+        return best, metrics
+
+
+def anchor_score(explanation, threshold):
+    precision = float(explanation.precision)
+    return precision >= threshold, precision, float(explanation.coverage)
+
+
+def get_anchor_engine(model, input_shape) -> AnchorEngine:
+    return model_engine(model, ("anchor", tuple(input_shape)), lambda: AnchorEngine(model, input_shape))
+
+
+def generate_anchor_for_image(
+    image,
+    model,
+    threshold=ANCHOR_THRESHOLD,
+    p_sample=.5,
+    preds=None,
+    time_budget_ms=None,
+    max_samples=None
+):
+    engine = get_anchor_engine(model, image.shape)
+
+    if preds is None:
+        preds = BudgetedPredictor(model)(np.expand_dims(image, axis=0))
     predicted_class_idx = np.argmax(preds[0])
 
-    explainer = AnchorImage(predict_fn, (224, 224, 3), segmentation_fn='slic', 
-                        segmentation_kwargs={'n_segments': n_segments, 'compactness': 20, 'sigma': .5}, 
-                        images_background=None)
-    explanation = explainer.explain(image, threshold=.95, p_sample=p_sample, tau=0.25)
+    explanation, metrics = engine.explain(
+        image,
+        threshold=threshold,
+        p_sample=p_sample,
+        tau=0.25,
+        time_budget_ms=time_budget_ms or ANCHOR_TIME_BUDGET_MS,
+        max_samples=max_samples or ANCHOR_MAX_SAMPLES
+    )
 
-    return explanation, predicted_class_idx, preds
\ No newline at end of file
+    return explanation, predicted_class_idx, preds, metrics
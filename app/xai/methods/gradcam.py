@@ -3,6 +3,8 @@ import tensorflow as tf
 from tensorflow.keras.models import Model
 import numpy as np
 import cv2
+from app.classification_models.model_loader import model_engine
+from app.xai.rendering import blend
 
 class myGradCAM: 
     def __init__(self, model, classIdx, layerName=None):
@@ -17,41 +19,13 @@ class myGradCAM:
         raise ValueError("Could not find 4D layer. Cannot apply GradCAM.")
 
     def compute_heatmap(self, image, eps=1e-8):
-        gradModel = Model(
-            inputs=[self.model.inputs],
-            outputs=[self.model.get_layer(self.layerName).output, self.model.output]
-        )
-
-        with tf.GradientTape() as tape:
-            inputs = tf.cast(image, tf.float32)
-            convOutputs, predictions = gradModel(inputs)
-            loss = predictions[:, self.classIdx]
-
-        grads = tape.gradient(loss, convOutputs)
-
-        castConvOutputs = tf.cast(convOutputs > 0, "float32")
-        castGrads = tf.cast(grads > 0, "float32")
-        guidedGrads = castConvOutputs * castGrads * grads
-        
-        convOutputs, guidedGrads = convOutputs[0], guidedGrads[0]
-
-        weights = tf.reduce_mean(guidedGrads, axis=(0, 1))
-        cam = tf.reduce_sum(tf.multiply(weights, convOutputs), axis=-1)
-
-        h, w = image.shape[1:3]
-        heatmap = cv2.resize(cam.numpy(), (w, h))
-        heatmap = np.maximum(heatmap, 0)
-    
-        numer = heatmap - np.min(heatmap)
-        denom = heatmap.max() - np.min(heatmap) + eps
-        heatmap = numer / denom
-        
-        heatmap = (heatmap * 255).astype("uint8")
-        return heatmap
+        engine = get_gradcam_engine(self.model, self.layerName)
+        _, _, heatmaps = engine.compute(image, class_indices=[[self.classIdx]] * len(image), eps=eps)
+        return heatmaps[0, 0]
         
     def overlay_heatmap(self, heatmap, image, alpha=0.5,colormap=cv2.COLORMAP_VIRIDIS): # 0.8 cv2.COLORMAP_JET cv2.COLORMAP_VIRIDIS
         heatmap = cv2.applyColorMap(heatmap, colormap)
-        output = cv2.addWeighted(image, alpha, heatmap.astype(np.uint8), 1 - alpha, 0)
+        output = blend(image, heatmap, alpha)
         return (heatmap, output)
         
     def apply_black_mask(self, heatmap, image, threshold=70, max_threshold=100):
@@ -74,16 +48,72 @@ class myGradCAM:
         return output
     
 
-def generate_gradcam_for_image(image, model, layer_name='block7a_project_conv', threshold=70, max_threshold=100): # conv5_block3_3_conv
+class GradCAMEngine:
+    # Builds the gradient sub-model once and compiles the whole Grad-CAM pass, so
+    # predictions and class activation maps come out of a single forward/backward.
+    def __init__(self, model, layer_name):
+        self.grad_model = Model(
+            inputs=[model.inputs],
+            outputs=[model.get_layer(layer_name).output, model.output]
+        )
+        self._compute_fn = tf.function(self._compute, reduce_retracing=True)
+
+    def _compute(self, images, class_indices=None, top_k=1):
+        with tf.GradientTape() as tape:
+            convOutputs, predictions = self.grad_model(images, training=False)
+            if class_indices is None:
+                class_indices = tf.math.top_k(predictions, k=top_k).indices
+            losses = tf.gather(predictions, class_indices, batch_dims=1)
+
+        # (N, K, h, w, c): gradients of every target class in one pass, with no Python loop
+        # over K, so one trace serves any number of classes
+        grads = tape.batch_jacobian(losses, convOutputs)
+        castConvOutputs = tf.cast(convOutputs > 0, "float32")[:, None]
+        guidedGrads = castConvOutputs * tf.cast(grads > 0, "float32") * grads
+        weights = tf.reduce_mean(guidedGrads, axis=(2, 3))
+        cams = tf.einsum("nhwc,nkc->nkhw", convOutputs, weights)
+
+        return predictions, class_indices, cams
+
+    def compute(self, images, class_indices=None, top_k=1, eps=1e-8):
+        # images: (N, H, W, C); class_indices: (N, K) or None for the top_k predicted classes
+        images = tf.cast(images, tf.float32)
+        if class_indices is not None:
+            class_indices = tf.constant(class_indices, dtype=tf.int32)
+        preds, class_indices, cams = self._compute_fn(images, class_indices, top_k)
+
+        h, w = images.shape[1:3]
+        cams = cams.numpy()
+        heatmaps = np.empty((*cams.shape[:2], h, w), dtype="uint8")
+        for n in range(cams.shape[0]):
+            for k in range(cams.shape[1]):
+                heatmap = np.maximum(cv2.resize(cams[n, k], (w, h)), 0)
+                numer = heatmap - np.min(heatmap)
+                denom = heatmap.max() - np.min(heatmap) + eps
+                heatmaps[n, k] = (numer / denom * 255).astype("uint8")
+
+        return preds.numpy(), class_indices.numpy(), heatmaps
+
+
+def get_gradcam_engine(model, layer_name) -> GradCAMEngine:
+    return model_engine(model, ("gradcam", layer_name), lambda: GradCAMEngine(model, layer_name))
+
+
+def generate_gradcam_for_image(image, model, layer_name='block7a_project_conv', threshold=70, max_threshold=100, preds=None): # conv5_block3_3_conv
     image_batch = np.expand_dims(image, axis=0)
+    engine = get_gradcam_engine(model, layer_name)
 
-    preds = model.predict(image_batch, verbose=0)
-    predicted_class_idx = np.argmax(preds[0])
+    if preds is None:
+        preds, class_indices, heatmaps = engine.compute(image_batch, top_k=1)
+        predicted_class_idx = class_indices[0, 0]
+    else:
+        predicted_class_idx = np.argmax(preds[0])
+        _, _, heatmaps = engine.compute(image_batch, class_indices=[[predicted_class_idx]])
 
     icam = myGradCAM(model, predicted_class_idx, layer_name)
-    heatmap = icam.compute_heatmap(image_batch)
-    heatmap = cv2.resize(heatmap, (224, 224))
+    heatmap = cv2.resize(heatmaps[0, 0], (224, 224))
 
     output_with_mask = icam.apply_black_mask(heatmap, image, threshold, max_threshold)
+    cam = heatmap
     heatmap, output = icam.overlay_heatmap(heatmap, image, alpha=0.6)
-    return predicted_class_idx, heatmap, output, output_with_mask, preds
\ No newline at end of file
+    return predicted_class_idx, heatmap, output, output_with_mask, preds, cam
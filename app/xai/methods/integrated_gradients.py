@@ -1,10 +1,16 @@
 
 from tensorflow.keras.applications.efficientnet import preprocess_input
-from matplotlib import pyplot as plt
+import cv2
 import numpy as np
 from scipy import ndimage
 import tensorflow as tf
 
+from app.classification_models.model_loader import model_engine
+from app.xai.config import IG_BATCH_SIZE, IG_USE_TF_FUNCTION
+from app.xai.rendering import superimpose
+
+EROSION_KERNEL = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+
 
 class IntegratedGradVisualizer:
     def __init__(self, positive_channel=None, negative_channel=None):
@@ -30,114 +36,121 @@ class IntegratedGradVisualizer:
                                         lower_end=0.2
                                     ):
         # 1. get the thresholds
-        m = self.get_thresholded_attributions(attributions, percentage=100 - clip_above_percentile)
-        e = self.get_thresholded_attributions(attributions, percentage=100 - clip_below_percentile)
+        m, e = self.get_thresholds(attributions, [100 - clip_above_percentile, 100 - clip_below_percentile])
+
+        # 2. transform the attributions
+        return self.transform_attributions(attributions, m, e, lower_end)
 
-        # 2.transform the attributions by a linear function f(x) = a*x + b such that
-        # f(m) = 1.0 and f(e) = lower_end
-        transformed_attributions = (1 - lower_end) * (np.abs(attributions) - e) / (m - e) + lower_end
+    def transform_attributions(self, attributions, m, e, lower_end):
+        # 1. transform the attributions by a linear function f(x) = a*x + b such that
+        # f(m) = 1.0 and f(e) = lower_end (in place, same order of operations as before)
+        transformed_attributions = np.abs(attributions) - e
+        transformed_attributions *= 1 - lower_end
+        transformed_attributions /= m - e
+        transformed_attributions += lower_end
 
-        # 3, Make sure that the sign of transformed attributions is the same as original attributions
+        # 2. Make sure that the sign of transformed attributions is the same as original attributions
         transformed_attributions *= np.sign(attributions)
 
-        # 4. Only keep values that are bigger than the lower_end
+        # 3. Only keep values that are bigger than the lower_end
         transformed_attributions *= (transformed_attributions >= lower_end)
 
-        # 5. Clip values and return 
-        transformed_attributions = np.clip(transformed_attributions, 0.0, 1.0)
-        return transformed_attributions
-        
-    def get_thresholded_attributions(self, attributions, percentage):
-        if percentage == 100.0:
-            return np.min(attributions)
-
-        # 1. Flatten the attributions
-        flatten_attr = attributions.flatten()
+        # 4. Clip values and return 
+        return np.clip(transformed_attributions, 0.0, 1.0, out=transformed_attributions)
 
-        # 2. Get the sum of the attributions
-        total = np.sum(flatten_attr)
+    def get_thresholds(self, attributions, percentages):
+        # Attribution value at which the largest attributions add up to `percentage` % of the
+        # total, for all percentages from a single sort
+        total = np.sum(attributions)
 
-        # 3. Sort the attributions from largest to smallest.
-        sorted_attributions = np.sort(np.abs(flatten_attr))[::-1]
+        # 1. Sort the attributions from largest to smallest.
+        sorted_attributions = np.sort(np.abs(attributions), axis=None)[::-1]
 
-        # 4. Calculate the percentage of the total sum that each attribution
+        # 2. Calculate the percentage of the total sum that each attribution
         # and the values about it contribute.
-        cum_sum = 100.0 * np.cumsum(sorted_attributions) / total
-
-        # 5. threshold the attributions by the percentage
-        indices_to_consider = np.where(cum_sum >= percentage)[0][0]
+        cum_sum = np.cumsum(sorted_attributions)
+        cum_sum *= 100.0
+        cum_sum /= total
+
+        # 3. threshold the attributions by the percentage
+        thresholds = []
+        for percentage in percentages:
+            if percentage == 100.0:
+                thresholds.append(np.min(attributions))
+                continue
+            index = min(np.searchsorted(cum_sum, percentage), len(cum_sum) - 1)
+            thresholds.append(sorted_attributions[index])
+        return thresholds
 
-        # 6. select the desired attributions and return
-        attributions = sorted_attributions[indices_to_consider]
-        return attributions
+    def get_thresholded_attributions(self, attributions, percentage):
+        return self.get_thresholds(attributions, [percentage])[0]
     
     def binarize(self, attributions, threshold=0.001):
         return attributions > threshold
     
     def morphological_cleanup_fn(self, attributions, structure=np.ones((4,4))):
-        closed = ndimage.grey_closing(attributions, structure=structure)
-        opened = ndimage.grey_opening(closed, structure=structure)
+        # grey closing then opening with a flat structuring element; for odd sizes OpenCV gives
+        # the same result as scipy's grey_closing / grey_opening at a fraction of the cost
+        kernel = (np.asarray(structure) != 0).astype(np.uint8)
+        closed = cv2.morphologyEx(attributions, cv2.MORPH_CLOSE, kernel)
+        opened = cv2.morphologyEx(closed, cv2.MORPH_OPEN, kernel)
         return opened
+
+    def fill_holes(self, mask):
+        # same as ndimage.binary_fill_holes: background components (4-connected) that do not
+        # touch the border are holes; one labelling pass instead of iterated dilations
+        background, num_background = ndimage.label(~mask)
+        border = np.concatenate([background[0], background[-1], background[:, 0], background[:, -1]])
+        is_hole = np.ones(num_background + 1, dtype=bool)
+        is_hole[border] = False
+        is_hole[0] = False
+        return mask | is_hole[background]
     
     def draw_outlines(self, attributions, percentage=90,connected_component_structure=np.ones((3,3))):
         # 1. Binarize the attributions.
         attributions = self.binarize(attributions)
         
         # 2. fill the gaps
-        attributions = ndimage.binary_fill_holes(attributions)
+        attributions = self.fill_holes(attributions)
 
         # 3. Compute connected components
         connected_components, num_comp = ndimage.label(attributions,structure=connected_component_structure)
+        if num_comp == 0:
+            return np.zeros_like(attributions)
 
-        # 4. Go sum up the attributions for each component
-        total = np.sum(attributions[connected_components > 0])
-        component_sums = []
-        
-        for comp in range(1, num_comp+1):
-            mask = connected_components == comp
-            component_sum = np.sum(attributions[mask])
-            component_sums.append((component_sum, mask))
+        # 4. Sum up the attributions for each component in one pass
+        labels = np.arange(1, num_comp + 1)
+        component_sums = ndimage.sum_labels(attributions, connected_components, index=labels)
+        total = np.sum(component_sums)
 
         # 5. Compute the percentage of top components to keep.
-        sorted_sums_and_masks = sorted(component_sums, key=lambda x: x[0], reverse=True)
-        sorted_sums = list(zip(*sorted_sums_and_masks))[0]
-        cumulative_sorted_sums = np.cumsum(sorted_sums)
+        order = np.argsort(-component_sums, kind="stable")
+        cumulative_sorted_sums = np.cumsum(component_sums[order])
         cutoff_threshold = percentage * total / 100
-        cutoff_idx = np.where(cumulative_sorted_sums >= cutoff_threshold)[0][0]
-
-        if cutoff_idx > 2:
-            cutoff_idx = 2
+        cutoff_idx = min(int(np.searchsorted(cumulative_sorted_sums, cutoff_threshold)), 2, num_comp - 1)
 
         # 6.Set the values for the kept components.
-        border_mask = np.zeros_like(attributions)
-        for i in range(cutoff_idx + 1):
-            border_mask[sorted_sums_and_masks[i][1]] = 1
-
+        keep = np.zeros(num_comp + 1, dtype=bool)
+        keep[labels[order[:cutoff_idx + 1]]] = True
+        border_mask = keep[connected_components]
 
-        # 7. Make the mask hollow and show only border
-        eroded_mask = ndimage.binary_erosion(border_mask, iterations=1)
-        border_mask[eroded_mask] = 0
+        # 7. Make the mask hollow and show only border (binary erosion, cross element, zero border)
+        eroded_mask = cv2.erode(border_mask.view(np.uint8), EROSION_KERNEL, borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        border_mask[eroded_mask.view(bool)] = 0
         
         # 8. return the outlined mask
         return border_mask
-    
-    def process_grads(self, image, attributions, polarity="positive", structure=np.ones((3,3)),
-                clip_above_percentile=99.9, clip_below_percentile=0,
-                morphological_cleanup=False,
-                outlines=False, outlines_component_percentage=90,
-                overlay=True,
-                ):
-        
+
+    def check_percentiles(self, polarity, *percentiles):
         if polarity not in ["positive", "negative"]:
             raise ValueError(f""" Allowed polarity values: 'positive' or 'negatiive'
                                     but provided {polarity}""")
-        
-        if clip_above_percentile < 0 or clip_above_percentile > 100:
-            raise ValueError('clip_above_percentile must be in [0, 100]')
 
-        if clip_below_percentile < 0 or clip_below_percentile > 100:
-            raise ValueError('clip_below_percentile must be in [0, 100]')
-        
+        for percentile in percentiles:
+            if percentile < 0 or percentile > 100:
+                raise ValueError('clip percentiles must be in [0, 100]')
+
+    def prepare_attributions(self, attributions, polarity="positive"):
         # 1. apply polarity
         if polarity == "positive":
             attributions = self.apply_polarity(attributions, polarity=polarity)
@@ -146,32 +159,50 @@ class IntegratedGradVisualizer:
             attributions = self.apply_polarity(attributions, polarity=polarity)
             attributions = np.abs(attributions)
             channel = self.negative_channel
-        
+
         # 2. Average over the channels
-        attributions = np.average(attributions, axis=2)
-        
-        # 3. Apply linear transformation to the attributions
-        attributions = self.apply_linear_transformation(attributions,
-                                                        clip_above_percentile=clip_above_percentile,
-                                                        clip_below_percentile=clip_below_percentile,
-                                                        lower_end=0.0
-                                                       )
-        # 4. cleanup
+        return np.average(attributions, axis=2), channel
+
+    def render(self, image, attributions, channel, m, e, structure=np.ones((3,3)),
+                morphological_cleanup=False,
+                outlines=False, outlines_component_percentage=90,
+                overlay=True,
+                ):
+        # 1. Apply linear transformation to the attributions
+        attributions = self.transform_attributions(attributions, m, e, lower_end=0.0)
+
+        # 2. cleanup
         if morphological_cleanup:
             attributions = self.morphological_cleanup_fn(attributions, structure=structure)
-        # 5. Draw the outlines
+        # 3. Draw the outlines
         if outlines:
             attributions = self.draw_outlines(attributions, percentage=outlines_component_percentage)
         
-        # 6. Expand the channel axis and convert to RGB
+        # 4. Expand the channel axis and convert to RGB
         attributions = np.expand_dims(attributions, 2) * channel
         
-        # 7. Super impose on the original image
+        # 5. Super impose on the original image
         if overlay:
 
-            attributions = np.clip((attributions * 0.8 + image), 0, 255)
+            attributions = superimpose(image, attributions.astype(image.dtype), 0.8)
             
         return attributions
+    
+    def process_grads(self, image, attributions, polarity="positive", structure=np.ones((3,3)),
+                clip_above_percentile=99.9, clip_below_percentile=0,
+                morphological_cleanup=False,
+                outlines=False, outlines_component_percentage=90,
+                overlay=True,
+                ):
+        self.check_percentiles(polarity, clip_above_percentile, clip_below_percentile)
+
+        attributions, channel = self.prepare_attributions(attributions, polarity)
+        m, e = self.get_thresholds(attributions, [100 - clip_above_percentile, 100 - clip_below_percentile])
+        return self.render(image, attributions, channel, m, e, structure=structure,
+                           morphological_cleanup=morphological_cleanup,
+                           outlines=outlines,
+                           outlines_component_percentage=outlines_component_percentage,
+                           overlay=overlay)
 
     def visualize(self,image, gradients, integrated_gradients,
                 polarity="positive", structure=np.ones((3,3)),
@@ -204,6 +235,9 @@ class IntegratedGradVisualizer:
                                     overlay=overlay
                                 )
         
+        # notebook helper, kept off the request path
+        from matplotlib import pyplot as plt
+
         f, ax = plt.subplots(1, 3, figsize=(12, 6))
         ax[0].imshow(image)
         ax[0].set_title("Original Image")
@@ -224,28 +258,30 @@ class IntegratedGradVisualizer:
                 clip_above_percentile_outlines=95, clip_below_percentile_outlines=28, 
                 outlines_component_percentage=90, outlines=False,
                 morphological_cleanup=False, overlay=True):
- 
-         
-         igrads_attr = self.process_grads(image=img1, attributions=integrated_gradients,
-                                    polarity=polarity, structure=structure,
-                                    clip_above_percentile=clip_above_percentile,
-                                    clip_below_percentile=clip_below_percentile,
-                                    morphological_cleanup=False,
-                                    outlines=False,
-                                    outlines_component_percentage=outlines_component_percentage,
-                                    overlay=False
-                                )
-         igrads_attr_outlines = self.process_grads(image=img1, attributions=integrated_gradients,
-                                    polarity=polarity, structure=structure,
-                                    clip_above_percentile=clip_above_percentile_outlines,
-                                    clip_below_percentile=clip_below_percentile_outlines,
-                                    morphological_cleanup=True,
-                                    outlines=True,
-                                    outlines_component_percentage=outlines_component_percentage,
-                                    overlay=overlay
-                                )
-         return igrads_attr, igrads_attr_outlines
-    
+        self.check_percentiles(polarity, clip_above_percentile, clip_below_percentile,
+                               clip_above_percentile_outlines, clip_below_percentile_outlines)
+
+        # polarity, channel average and the sort for all four thresholds are shared
+        # between the heatmap and the outlines
+        attributions, channel = self.prepare_attributions(integrated_gradients, polarity)
+        m, e, m_outlines, e_outlines = self.get_thresholds(attributions, [
+            100 - clip_above_percentile,
+            100 - clip_below_percentile,
+            100 - clip_above_percentile_outlines,
+            100 - clip_below_percentile_outlines
+        ])
+
+        igrads_attr = self.render(img1, attributions, channel, m, e, structure=structure,
+                                  morphological_cleanup=False,
+                                  outlines=False,
+                                  overlay=False)
+        igrads_attr_outlines = self.render(img1, attributions, channel, m_outlines, e_outlines, structure=structure,
+                                           morphological_cleanup=True,
+                                           outlines=True,
+                                           outlines_component_percentage=outlines_component_percentage,
+                                           overlay=overlay)
+        return igrads_attr, igrads_attr_outlines
+
     def visualize_ig_with_outlines(self,image, integrated_gradients,
                 polarity="positive", structure=np.ones((3,3)),
                 clip_above_percentile=99, clip_below_percentile=0, 
@@ -263,6 +299,9 @@ class IntegratedGradVisualizer:
                                                 outlines_component_percentage=outlines_component_percentage, overlay=overlay
                                             )
         
+        # notebook helper, kept off the request path
+        from matplotlib import pyplot as plt
+
         f, ax = plt.subplots(1, 3, figsize=(12, 6))
         ax[0].imshow(image)
         ax[0].set_title("Original Image")
@@ -278,69 +317,83 @@ class IntegratedGradVisualizer:
         plt.show()
 
 
+def get_gradient_fn(model, use_tf_function=IG_USE_TF_FUNCTION):
+    return model_engine(model, ("ig", use_tf_function), lambda: build_gradient_fn(model, use_tf_function))
+
+
+def build_gradient_fn(model, use_tf_function=IG_USE_TF_FUNCTION):
+    def gradient_fn(images, predicted_class_idx):
+        with tf.GradientTape() as tape:
+            tape.watch(images)
+            preds = model(images, training=False)
+            predicted_class = tf.gather(preds, predicted_class_idx, axis=1)
+        return tape.gradient(predicted_class, images)
+
+    if use_tf_function:
+        gradient_fn = tf.function(gradient_fn, reduce_retracing=True)
+    return gradient_fn
+
+
 def get_gradients(image, predicted_class_idx, model):
     images = tf.cast(image, tf.float32)
-    
-    with tf.GradientTape() as tape:
-        tape.watch(images)
-        preds = model(images)
-        predicted_class = preds[:, predicted_class_idx]
-    
-    grads = tape.gradient(predicted_class, images)
-    return grads
+    gradient_fn = get_gradient_fn(model)
+    return gradient_fn(images, tf.constant(int(predicted_class_idx), dtype=tf.int32))
+
+
+def get_path_integrated_gradients(image, predicted_class_idx, model, baselines, num_steps=50,
+                                  batch_size=IG_BATCH_SIZE, use_tf_function=IG_USE_TF_FUNCTION):
+    # All (baseline, step) pairs are flattened into one path of runs * (num_steps + 1)
+    # points, and gradients are taken chunk by chunk instead of one image at a time.
+    image = tf.convert_to_tensor(image, dtype=tf.float32)
+    baselines = tf.convert_to_tensor(baselines, dtype=tf.float32)
+    num_runs = baselines.shape[0]
+    num_points = num_steps + 1
+
+    alphas = tf.tile(tf.linspace(0.0, 1.0, num_points), [num_runs])
+    baseline_idx = tf.repeat(tf.range(num_runs), num_points)
+
+    gradient_fn = get_gradient_fn(model, use_tf_function)
+    class_idx = tf.constant(int(predicted_class_idx), dtype=tf.int32)
+
+    # trapezoidal rule, accumulated chunk by chunk instead of keeping every path gradient:
+    # weight 1/2 at both ends of each run, 1 in between, divided by num_steps
+    step_weights = tf.concat([[0.5], tf.ones(num_steps - 1), [0.5]], axis=0) / num_steps
+    weights = tf.tile(step_weights, [num_runs])
+    avg_grads = tf.zeros((num_runs, *image.shape), dtype=tf.float32)
+
+    for start in range(0, num_runs * num_points, batch_size):
+        chunk_alphas = alphas[start:start + batch_size][:, None, None, None]
+        chunk_idx = baseline_idx[start:start + batch_size]
+        chunk_baselines = tf.gather(baselines, chunk_idx)
+        interpolated = chunk_baselines + chunk_alphas * (image[None] - chunk_baselines)
+        interpolated = preprocess_input(interpolated)
+        grads = gradient_fn(interpolated, class_idx)
+        weighted = grads * weights[start:start + batch_size][:, None, None, None]
+        avg_grads += tf.math.unsorted_segment_sum(weighted, chunk_idx, num_runs)
+
+    integrated_grads = (image[None] - baselines) * avg_grads
+    return tf.reduce_mean(integrated_grads, axis=0)
 
 
 def get_integrated_gradients(image, predicted_class_idx, model, baseline=None, num_steps=50):
-    img_size = (224, 224, 3)
-    if baseline is None:
-        baseline = np.zeros(img_size).astype(np.float32)
-    else:
-        baseline = baseline.astype(np.float32)
-        
     image = image.astype(np.float32)
-    interpolated_image = [baseline + (step / num_steps)*(image - baseline) for step in range(num_steps + 1)]
-    interpolated_image = np.array(interpolated_image).astype(np.float32)
-    interpolated_image = preprocess_input(interpolated_image)
-    
-    
-    grads = []
-    for i, img in enumerate(interpolated_image):
-        img = tf.expand_dims(img, axis=0)
-        grad = get_gradients(img, predicted_class_idx, model)
-        #print("Gradients computed", grad.shape)
-        grads.append(grad[0])
-        
-    grads = tf.convert_to_tensor(grads, dtype=tf.float32)
-    
-    # trapezoidal rule
-    grads = (grads[:-1] + grads[1:]) / 2.0
-    avg_grads = tf.reduce_mean(grads, axis=0)
-    
-    integrated_grads = (image - baseline) * avg_grads    
-    return integrated_grads
+    if baseline is None:
+        baseline = np.zeros(image.shape, dtype=np.float32)
+
+    baselines = np.expand_dims(baseline.astype(np.float32), axis=0)
+    return get_path_integrated_gradients(image, predicted_class_idx, model, baselines, num_steps=num_steps)
 
 
 def random_baseline_integrated_gradients(image, predicted_class_idx, model, num_steps=50, num_runs=10):
-    img_size = (224, 224, 3)
-    integrated_grads = []
-    
-    for run in range(num_runs):
-        baseline = (np.random.random(img_size) * 255)
-        igrads = get_integrated_gradients(image=image,
-                                          predicted_class_idx=predicted_class_idx,
-                                          model=model,
-                                          baseline=baseline,
-                                          num_steps=num_steps,
-                                         )
-        integrated_grads.append(igrads)
-        
-    integrated_grads = tf.convert_to_tensor(integrated_grads)
-    return tf.reduce_mean(integrated_grads, axis=0)
+    image = image.astype(np.float32)
+    baselines = (np.random.random((num_runs, *image.shape)) * 255).astype(np.float32)
+    return get_path_integrated_gradients(image, predicted_class_idx, model, baselines, num_steps=num_steps)
 
 
-def generate_integrated_gradients_for_image(image, model):
+def generate_integrated_gradients_for_image(image, model, preds=None):
     image_batch = np.expand_dims(image, axis=0)
-    preds = model.predict(image_batch, verbose=0)
+    if preds is None:
+        preds = model.predict(image_batch, verbose=0)
     predicted_class_idx = np.argmax(preds[0])
     grads = get_gradients(image_batch, predicted_class_idx, model)
     igrads = random_baseline_integrated_gradients(np.copy(image),
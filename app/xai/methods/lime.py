@@ -1,22 +1,139 @@
-from lime import lime_image
-from skimage.segmentation import mark_boundaries
+from lime.lime_base import LimeBase
+from lime.lime_image import ImageExplanation
+from sklearn.linear_model import Ridge
+from sklearn.utils import check_random_state
 import numpy as np
-import contextlib
-import io
-
-
-def generate_lime_for_image(image, model, top_labels=5, num_samples=300): # 1000
-    def silent_predict(images):
-        with contextlib.redirect_stdout(io.StringIO()):
-            return model.predict(images, verbose=0)
-    
-    image_batch = np.expand_dims(image, axis=0)
-    
-    preds = model.predict(image_batch, verbose=0)
+
+from app.xai.config import (
+    LIME_BATCH_SIZE,
+    LIME_EARLY_STOP_PATIENCE,
+    LIME_EARLY_STOP_TOL,
+    LIME_MIN_SAMPLES,
+    LIME_NUM_SAMPLES
+)
+from app.xai.methods.segmentation import get_segments
+from app.xai.rendering import outline
+
+# LimeImageExplainer defaults, with a fixed seed so the segmentation can be cached
+QUICKSHIFT_PARAMS = {"kernel_size": 4, "max_dist": 200, "ratio": 0.2, "rng": 42}
+KERNEL_WIDTH = 0.25
+ALL_FEATURES = 100000
+
+
+def lime_kernel(distances, kernel_width=KERNEL_WIDTH):
+    return np.sqrt(np.exp(-(distances ** 2) / kernel_width ** 2))
+
+
+def distances_to_original(data: np.ndarray) -> np.ndarray:
+    # cosine distance of each binary row to the all-ones row, i.e. 1 - sqrt(kept / total)
+    return 1.0 - np.sqrt(data.sum(axis=1) / data.shape[1])
+
+
+# Same sampling and surrogate as lime's LimeImageExplainer, but the perturbed images are
+# built for a whole batch with one fancy-index, evaluated with predict_on_batch in large
+# batches, and sampling stops early once the surrogate weights of the explained class settle.
+class LimeEngine:
+    def __init__(
+        self,
+        model,
+        batch_size=LIME_BATCH_SIZE,
+        min_samples=LIME_MIN_SAMPLES,
+        tol=LIME_EARLY_STOP_TOL,
+        patience=LIME_EARLY_STOP_PATIENCE,
+        random_state=None
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.min_samples = min_samples
+        self.tol = tol
+        self.patience = patience
+        self.random_state = check_random_state(random_state)
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(images.astype(np.float32)))
+
+    def perturb(self, image, fudged_image, segments, rows) -> np.ndarray:
+        keep = rows.astype(bool)[:, segments]
+        return np.where(keep[..., None], image, fudged_image)
+
+    def surrogate_weights(self, data, labels, label) -> np.ndarray:
+        model = Ridge(alpha=1, fit_intercept=True, random_state=self.random_state)
+        model.fit(data, labels[:, label], sample_weight=lime_kernel(distances_to_original(data)))
+        return model.coef_
+
+    def sample(self, image, fudged_image, segments, label, num_samples):
+        n_features = int(segments.max()) + 1
+        data = self.random_state.randint(0, 2, size=(num_samples, n_features)).astype(np.uint8)
+        data[0, :] = 1
+
+        labels = []
+        evaluated = 0
+        previous = None
+        stable = 0
+
+        for start in range(0, num_samples, self.batch_size):
+            rows = data[start:start + self.batch_size]
+            labels.append(self.predict(self.perturb(image, fudged_image, segments, rows)))
+            evaluated = start + len(rows)
+
+            if evaluated < min(self.min_samples, num_samples) or evaluated >= num_samples or label is None:
+                continue
+
+            weights = self.surrogate_weights(data[:evaluated], np.concatenate(labels), label)
+            if previous is not None:
+                change = np.linalg.norm(weights - previous) / (np.linalg.norm(previous) + 1e-12)
+                stable = stable + 1 if change < self.tol else 0
+                if stable >= self.patience:
+                    break
+            previous = weights
+
+        return data[:evaluated], np.concatenate(labels)
+
+    def explain(self, image, label=None, top_labels=5, num_samples=LIME_NUM_SAMPLES, hide_color=0):
+        segments = get_segments(image, "quickshift", **QUICKSHIFT_PARAMS)
+
+        if hide_color is None:
+            # per-segment mean colour, like lime
+            counts = np.bincount(segments.ravel())
+            means = np.stack([
+                np.bincount(segments.ravel(), weights=image[..., c].ravel()) / np.maximum(counts, 1)
+                for c in range(image.shape[-1])
+            ], axis=-1)
+            fudged_image = means[segments].astype(image.dtype)
+        else:
+            fudged_image = np.full_like(image, hide_color)
+
+        data, labels = self.sample(image, fudged_image, segments, label, num_samples)
+        distances = distances_to_original(data)
+
+        explanation = ImageExplanation(image, segments)
+        top = np.argsort(labels[0])[-top_labels:]
+        explanation.top_labels = list(reversed(top))
+        explanation.num_samples = len(data)
+
+        base = LimeBase(lime_kernel, verbose=False, random_state=self.random_state)
+        for top_label in top:
+            (
+                explanation.intercept[top_label],
+                explanation.local_exp[top_label],
+                explanation.score[top_label],
+                explanation.local_pred[top_label]
+            ) = base.explain_instance_with_data(
+                data, labels, distances, top_label, ALL_FEATURES, feature_selection="auto"
+            )
+        return explanation
+
+
+def generate_lime_for_image(image, model, top_labels=5, num_samples=LIME_NUM_SAMPLES, preds=None): # 1000
+    engine = LimeEngine(model)
+
+    if preds is None:
+        preds = engine.predict(np.expand_dims(image, axis=0))
     predicted_class_idx = np.argmax(preds[0])
 
-    explainer = lime_image.LimeImageExplainer()
-    explanation = explainer.explain_instance(image, silent_predict, top_labels=top_labels, num_samples=num_samples, hide_color=0)
+    explanation = engine.explain(
+        image, label=predicted_class_idx, top_labels=top_labels, num_samples=num_samples, hide_color=0
+    )
 
     if predicted_class_idx not in explanation.local_exp:
         # print(f"Class {predicted_class_idx} not found in explanation, skipping...")
@@ -26,8 +143,10 @@ def generate_lime_for_image(image, model, top_labels=5, num_samples=300): # 1000
 
 
 def get_lime_heatmap(explanation, predicted_class_idx):
-    dict_heatmap = dict(explanation.local_exp[predicted_class_idx])
-    heatmap = np.vectorize(dict_heatmap.get)(explanation.segments) 
+    segment_ids, weights = zip(*explanation.local_exp[predicted_class_idx])
+    lookup = np.zeros(int(explanation.segments.max()) + 1, dtype=np.float64)
+    lookup[list(segment_ids)] = weights
+    heatmap = lookup[explanation.segments]
     heatmap_norm = (heatmap - heatmap.min()) / (heatmap.max() - heatmap.min() + 1e-8)
     return heatmap_norm
 
@@ -39,5 +158,4 @@ def get_lime_overlay(explanation, predicted_class_idx, num_features=10):
         hide_rest=False,
         num_features=num_features
     )
-    overlay = mark_boundaries(temp / 255.0, mask)
-    return (overlay * 255).astype("uint8")
+    return outline(temp, mask)
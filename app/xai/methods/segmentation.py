@@ -0,0 +1,46 @@
+import hashlib
+import json
+
+import numpy as np
+
+from app.utils.result_cache import MemoryCache
+from app.xai.config import SEGMENTS_CACHE_MAX_ENTRIES, SEGMENTS_CACHE_TTL_SECONDS
+
+# superpixels by image content and parameters; segmentation is deterministic for a fixed seed,
+# so repeated LIME / Anchor explanations of the same image skip it
+segments_cache = MemoryCache(
+    max_entries=SEGMENTS_CACHE_MAX_ENTRIES,
+    max_bytes=SEGMENTS_CACHE_MAX_ENTRIES * 224 * 224 * 8,
+    ttl_seconds=SEGMENTS_CACHE_TTL_SECONDS
+)
+
+
+def segmentation_key(image: np.ndarray, algorithm: str, params: dict) -> str:
+    digest = hashlib.sha1(np.ascontiguousarray(image).tobytes())
+    digest.update(f"{image.shape}|{image.dtype}|{algorithm}|{json.dumps(params, sort_keys=True)}".encode())
+    return digest.hexdigest()
+
+
+def segment_image(image: np.ndarray, algorithm: str, **params) -> np.ndarray:
+    from skimage import segmentation
+
+    if algorithm == "quickshift":
+        return segmentation.quickshift(image, **params)
+    if algorithm == "slic":
+        return segmentation.slic(image, **params)
+    if algorithm == "felzenszwalb":
+        return segmentation.felzenszwalb(image, **params)
+    raise ValueError(f"Unknown segmentation algorithm: {algorithm}")
+
+
+def get_segments(image: np.ndarray, algorithm: str, **params) -> np.ndarray:
+    key = segmentation_key(image, algorithm, params)
+    cached = segments_cache.get(key)
+    if cached is not None:
+        return cached["segments"]
+
+    segments = segment_image(image, algorithm, **params)
+    # shared between requests, nobody may write into it
+    segments.setflags(write=False)
+    segments_cache.set(key, {"segments": segments})
+    return segments
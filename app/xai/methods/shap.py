@@ -1,48 +1,111 @@
-import cv2
+import threading
+import time
+from contextlib import contextmanager
+
 import numpy as np
 import shap
 
+from app.classification_models.model_loader import model_engine
 from app.constants import CLASS_LABELS
-
-def generate_shap_for_image(image, model, class_labels=CLASS_LABELS, top_k=None, specific_classes=None):
-    def f(X):
-        tmp = X.copy()
-        return model(tmp)
-
-    # num_available_samples = len(x_test)
-    # background_samples = min(background_samples, num_available_samples)
-    # random_indices = np.random.choice(num_available_samples, background_samples, replace=False)
-    # X_background = x_test[random_indices]
-    # masker_blur = shap.maskers.Image("blur(128,128)", X_background[0].shape
-    # explainer_blur = shap.Explainer(f, masker_blur, output_names=class_labels)
-
-    blurred_image = cv2.GaussianBlur(image, (51, 51), 0)
-    background = np.expand_dims(blurred_image, axis=0)
-    masker = shap.maskers.Image("blur(128,128)", image.shape)
-    explainer = shap.Explainer(f, masker, output_names=class_labels)
-
+from app.xai.config import SHAP_BATCH_SIZE, SHAP_MAX_EVALS, SHAP_MIN_EVALS
+
+# weight of the newest run in the seconds-per-evaluation estimate used for latency budgets
+COST_SMOOTHING = 0.3
+
+
+# Keeps ready-made maskers/explainers per (model, input shape) instead of rebuilding them on
+# every request. Explainers hold per-call state, so each concurrent call checks one out of a
+# small pool. Batches go straight to the model's compiled predict_on_batch, without copies.
+class ShapEngine:
+    def __init__(self, model, input_shape, class_labels=CLASS_LABELS):
+        self.model = model
+        self.input_shape = tuple(input_shape)
+        self.class_labels = list(class_labels)
+        self.seconds_per_eval = None
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def predict(self, X):
+        return np.asarray(self.model.predict_on_batch(np.asarray(X, dtype=np.float32)))
+
+    def _create_explainer(self):
+        masker = shap.maskers.Image("blur(128,128)", self.input_shape)
+        return shap.Explainer(self.predict, masker, output_names=self.class_labels)
+
+    @contextmanager
+    def explainer(self):
+        with self._lock:
+            explainer = self._idle.pop() if self._idle else None
+        if explainer is None:
+            explainer = self._create_explainer()
+        try:
+            yield explainer
+        finally:
+            with self._lock:
+                self._idle.append(explainer)
+
+    def evals_for_budget(self, max_evals: int, time_budget_ms=None) -> int:
+        if not time_budget_ms or self.seconds_per_eval is None:
+            return max_evals
+        affordable = int(time_budget_ms / 1000.0 / self.seconds_per_eval)
+        return max(SHAP_MIN_EVALS, min(max_evals, affordable))
+
+    def explain(self, image_batch, outputs, max_evals=SHAP_MAX_EVALS, batch_size=SHAP_BATCH_SIZE):
+        started = time.perf_counter()
+        with self.explainer() as explainer:
+            shap_values = explainer(image_batch, max_evals=max_evals, batch_size=batch_size, outputs=outputs)
+
+        cost = (time.perf_counter() - started) / max_evals
+        with self._lock:
+            if self.seconds_per_eval is None:
+                self.seconds_per_eval = cost
+            else:
+                self.seconds_per_eval = (1 - COST_SMOOTHING) * self.seconds_per_eval + COST_SMOOTHING * cost
+        return shap_values
+
+
+def get_shap_engine(model, input_shape, class_labels=CLASS_LABELS) -> ShapEngine:
+    key = ("shap", tuple(input_shape), tuple(class_labels))
+    return model_engine(model, key, lambda: ShapEngine(model, input_shape, class_labels))
+
+
+def generate_shap_for_image(
+    image,
+    model,
+    class_labels=CLASS_LABELS,
+    top_k=1,
+    specific_classes=None,
+    preds=None,
+    max_evals=None,
+    batch_size=None,
+    time_budget_ms=None
+):
+    engine = get_shap_engine(model, image.shape, class_labels)
     image_batch = np.expand_dims(image, axis=0)
-    preds = model.predict(image_batch, verbose=0)
+
+    if preds is None:
+        preds = engine.predict(image_batch)
     predicted_class_idx = np.argmax(preds[0])
 
+    # every requested class is explained by the same partition run
     if specific_classes is not None:
-        output_indices = specific_classes
-    elif top_k is not None:
-        output_indices = shap.Explanation.argsort.flip[:top_k]
+        output_indices = np.asarray(specific_classes)
     else:
-       # output_indices = [predicted_class_idx]
-        output_indices = shap.Explanation.argsort.flip[:len(class_labels)]
+        output_indices = np.argsort(preds[0])[::-1][:top_k or len(class_labels)]
 
-    # shap_values = explainer_blur(image_batch, max_evals=500, batch_size=50, outputs=output_indices)
-    shap_values = explainer(image_batch, max_evals=200, batch_size=50, outputs=output_indices) # 500
+    max_evals = engine.evals_for_budget(max_evals or SHAP_MAX_EVALS, time_budget_ms)
+    shap_values = engine.explain(
+        image_batch, output_indices, max_evals=max_evals, batch_size=batch_size or SHAP_BATCH_SIZE
+    )
 
     #shap.image_plot(shap_values)
-    return shap_values, predicted_class_idx, preds
+    metrics = {"max_evals": int(max_evals), "classes": [class_labels[int(i)] for i in output_indices]}
+    return shap_values, predicted_class_idx, preds, metrics
 
 
-def get_shap_heatmap(shap_values):
-    shap_array = shap_values.values[0, :, :, 0]
-    shap_2d = shap_array.sum(axis=-1)
+def get_shap_heatmap(shap_values, rank=0):
+    # rank: position among the explained classes, 0 is the most probable one
+    shap_2d = shap_values.values[0, :, :, 0, rank]
 
     shap_2d_norm = (shap_2d - shap_2d.min()) / (shap_2d.max() - shap_2d.min() + 1e-8)
 
@@ -74,4 +137,3 @@ def get_shap_overlay(original_image, shap_val, alpha=0.4):
     overlay = np.clip(overlay, 0, 1)
 
     return overlay
- 
\ No newline at end of file
@@ -1,13 +1,28 @@
 from dataclasses import dataclass
 from typing import Optional, List
+import numpy as np
 
 @dataclass
 class ExplanationItem:
     method: str
     overlay_image_id: Optional[str]  # GridFS або base64
     heatmap_image_id: Optional[str]
+    model_version: Optional[str] = None
+    image_content_type: Optional[str] = None  # of the overlay and heatmap
+    attribution_map_id: Optional[str] = None  # GridFS або base64, only with ARTIFACT_RAW_MAP
+    attribution_map_content_type: Optional[str] = None
+    attribution_range: Optional[List[float]] = None  # uint8 maps: code 0 -> min, 255 -> max
+    target_class: Optional[str] = None  # extra items of one method (SHAP top_k): the class they explain
 
 @dataclass
 class Explanation:
     history_id: Optional[str] = None
-    explanations: List[ExplanationItem] = None
\ No newline at end of file
+    explanations: List[ExplanationItem] = None
+
+
+@dataclass
+class PreparedImage:
+    original: np.ndarray  # cleaned 224x224 RGB image
+    image: np.ndarray  # model input
+    preds: np.ndarray
+    model_version: str
@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+# ColorBrewer "Spectral" as matplotlib defines it: 11 RGB anchors evenly spaced over [0, 1]
+SPECTRAL_ANCHORS = np.array([
+    (158, 1, 66),
+    (213, 62, 79),
+    (244, 109, 67),
+    (253, 174, 97),
+    (254, 224, 139),
+    (255, 255, 191),
+    (230, 245, 152),
+    (171, 221, 164),
+    (102, 194, 165),
+    (50, 136, 189),
+    (94, 79, 162),
+], dtype=np.float64) / 255.0
+
+LUT_SIZE = 256
+
+
+def build_lut(anchors: np.ndarray, size: int = LUT_SIZE) -> np.ndarray:
+    # piecewise-linear between the anchors, sampled the way matplotlib builds its 256-entry table
+    positions = np.linspace(0.0, 1.0, len(anchors))
+    samples = np.linspace(0.0, 1.0, size)
+    lut = np.stack([np.interp(samples, positions, anchors[:, channel]) for channel in range(3)], axis=-1)
+    return (lut * 255).astype(np.uint8)
+
+
+# (256, 3) uint8 RGB tables, built once at import
+COLORMAPS = {
+    "spectral": build_lut(SPECTRAL_ANCHORS),
+}
+
+
+def quantize(values: np.ndarray) -> np.ndarray:
+    # [0, 1] -> LUT index, floor(x * 256) clipped like matplotlib; out of range values take the end colors
+    codes = np.multiply(values, LUT_SIZE, dtype=np.float32)
+    np.clip(codes, 0, LUT_SIZE - 1, out=codes)
+    return codes.astype(np.uint8)
+
+
+def colorize(values: np.ndarray, colormap: str = "spectral") -> np.ndarray:
+    # float map in [0, 1] -> (H, W, 3) uint8 RGB
+    return np.take(COLORMAPS[colormap], quantize(values), axis=0)
+
+
+def colorize_labels(labels: np.ndarray, colormap: str = "spectral") -> np.ndarray:
+    # label 0 is background (black); labels 1..n spread over the colormap in order
+    num_labels = int(labels.max()) + 1
+    positions = np.rint(np.linspace(0, LUT_SIZE - 1, num_labels)).astype(np.intp)
+    table = np.zeros((num_labels, 3), dtype=np.uint8)
+    table[1:] = COLORMAPS[colormap][positions[:-1]]
+    return np.take(table, labels, axis=0)
+
+
+def blend(image: np.ndarray, heatmap: np.ndarray, alpha: float = 0.5) -> np.ndarray:
+    # alpha weights the image, 1 - alpha the heatmap; saturates to uint8
+    return cv2.addWeighted(image, alpha, heatmap, 1 - alpha, 0, dtype=cv2.CV_8U)
+
+
+def superimpose(image: np.ndarray, layer: np.ndarray, weight: float = 1.0) -> np.ndarray:
+    # image at full strength plus weight * layer, saturates to uint8; both must share a dtype
+    return cv2.addWeighted(image, 1.0, layer, weight, 0, dtype=cv2.CV_8U)
+
+
+def outline(image: np.ndarray, labels: np.ndarray, color=(255, 255, 0)) -> np.ndarray:
+    # uint8 copy of the image with the outer boundaries of the labelled regions drawn in color
+    from skimage.segmentation import find_boundaries
+
+    output = image.astype(np.uint8, copy=True)
+    output[find_boundaries(labels, mode="outer")] = color
+    return output
@@ -1,28 +1,28 @@
-from fastapi import APIRouter, UploadFile, File, Depends, Form
+from fastapi import APIRouter, UploadFile, File, Depends, Form, Header, HTTPException, Query, Response
 from fastapi.responses import JSONResponse
-from gridfs import GridFS
 from app.auth.dependencies import get_current_user_optional
-from app.db.mongo import get_mongo_db
+from app.constants import CLASS_LABELS
+from app.db.mongo import get_async_db
+from app.db.repositories import ImageRepository
 from app.utils.getters_services import get_image_from_gridfs
 from app.utils.history_cleanup import delete_all_images
 from app.utils.exceptions import (
     invalid_image_id_exception, 
     image_not_found_exception,
     invalid_lime_image_exception,
-    invalid_image_exception
+    invalid_image_exception,
+    blob_not_found_exception
 )
-from app.xai.models import Explanation, ExplanationItem
+from app.xai.config import XAI_BLOB_TTL_SECONDS
+from app.xai.delivery import get_blob, response_mode
 from app.xai.schemas import XAIResponse
-from app.xai.service import ( 
-    explain_image_with_gradcam, explain_image_with_integrated_gradients, explain_image_with_lime, 
-    explain_image_with_anchor, explain_image_with_shap,
-    handle_authenticated_user, handle_unknown_user
+from app.xai.service import (
+    build_xai_response, build_multi_xai_response,
+    parse_methods, resolve_model_version, run_explanation, run_explanations
 )
-import cv2
 from typing import Optional
-from pymongo.database import Database
+from pymongo.asynchronous.database import AsyncDatabase
 from bson import ObjectId
-from dataclasses import asdict
 
 xai_router = APIRouter()
 
@@ -31,186 +31,174 @@ xai_router = APIRouter()
 async def gradcam_explanation(
     file: UploadFile = File(...),
     history_id: Optional[str] = Form(None),
-    db: Database = Depends(get_mongo_db),
+    accept: Optional[str] = Header(None),
+    db: AsyncDatabase = Depends(get_async_db),
     user: Optional[dict] = Depends(get_current_user_optional)
 ):
-    result = await explain_image_with_gradcam(file)
-
-    overlay_bgr = cv2.cvtColor(result["overlay"], cv2.COLOR_RGB2BGR)
-    heatmap_bgr = cv2.cvtColor(result["heatmap"], cv2.COLOR_RGB2BGR)
-    if user:
-        explanation_item = handle_authenticated_user(db, file, "gradcam", overlay_bgr, heatmap_bgr, history_id)
-    else:
-        explanation_item = handle_unknown_user("gradcam", overlay_bgr, heatmap_bgr)
-
-    explanation_response = Explanation(
-        history_id=history_id,
-        explanations=[explanation_item]
-    )
-    return XAIResponse(
-        predicted_class=result["predicted_class"],
-        predicted_probs=result["predicted_probs"],
-        explanations=asdict(explanation_response)
-    )
+    image_data = await file.read()
+    model_version = await resolve_model_version(db, user, history_id, image_data)
+    result = await run_explanation("gradcam", image_data, model_version)
+
+    return await build_xai_response(db, user, "gradcam", result, file.filename, history_id, model_version, response_mode(accept))
 
 
 @xai_router.post("/lime", response_model=XAIResponse)
 async def lime_explanation(
     file: UploadFile = File(...),
     history_id: Optional[str] = Form(None),
-    db: Database = Depends(get_mongo_db),
+    accept: Optional[str] = Header(None),
+    db: AsyncDatabase = Depends(get_async_db),
     user: Optional[dict] = Depends(get_current_user_optional)
 ):
-    result = await explain_image_with_lime(file)
+    image_data = await file.read()
+    model_version = await resolve_model_version(db, user, history_id, image_data)
+    result = await run_explanation("lime", image_data, model_version)
 
     if result is None:
         raise invalid_lime_image_exception
     
-    overlay_bgr = cv2.cvtColor(result["overlay"], cv2.COLOR_RGB2BGR)
-    heatmap_bgr = cv2.cvtColor(result["heatmap"], cv2.COLOR_RGB2BGR)
-
-    if user:
-        explanation_item = handle_authenticated_user(db, file, "lime", overlay_bgr, heatmap_bgr, history_id)
-    else:
-        explanation_item = handle_unknown_user("lime", overlay_bgr, heatmap_bgr)
-
-    explanation_response = Explanation(
-        history_id=history_id,
-        explanations=[explanation_item]
-    )
-    return XAIResponse(
-        predicted_class=result["predicted_class"],
-        predicted_probs=result["predicted_probs"],
-        explanations=asdict(explanation_response)
-    )
+    return await build_xai_response(db, user, "lime", result, file.filename, history_id, model_version, response_mode(accept))
     
 
 @xai_router.post("/anchor", response_model=XAIResponse)
 async def anchor_explanation(
     file: UploadFile = File(...),
     history_id: Optional[str] = Form(None),
-    db: Database = Depends(get_mongo_db),
+    time_budget_ms: Optional[int] = Query(None, ge=500, le=120000),
+    max_samples: Optional[int] = Query(None, ge=100, le=100000),
+    accept: Optional[str] = Header(None),
+    db: AsyncDatabase = Depends(get_async_db),
     user: Optional[dict] = Depends(get_current_user_optional)
 ):
-    result = await explain_image_with_anchor(file)
+    image_data = await file.read()
+    model_version = await resolve_model_version(db, user, history_id, image_data)
+    result = await run_explanation(
+        "anchor", image_data, model_version, time_budget_ms=time_budget_ms, max_samples=max_samples
+    )
 
     if result is None:
         raise invalid_image_exception
     
-    overlay_bgr = cv2.cvtColor(result["overlay"], cv2.COLOR_RGB2BGR)
-    heatmap_bgr = cv2.cvtColor(result["heatmap"], cv2.COLOR_RGB2BGR)
-
-    if user:
-        explanation_item = handle_authenticated_user(db, file, "anchor", overlay_bgr, heatmap_bgr, history_id)
-    else:
-        explanation_item = handle_unknown_user("anchor", overlay_bgr, heatmap_bgr)
-
-    explanation_response = Explanation(
-        history_id=history_id,
-        explanations=[explanation_item]
-    )
-    return XAIResponse(
-        predicted_class=result["predicted_class"],
-        predicted_probs=result["predicted_probs"],
-        explanations=asdict(explanation_response)
-    )
+    return await build_xai_response(db, user, "anchor", result, file.filename, history_id, model_version, response_mode(accept))
 
      
 @xai_router.post("/shap", response_model=XAIResponse)
 async def shap_explanation(
     file: UploadFile = File(...),
     history_id: Optional[str] = Form(None),
-    db: Database = Depends(get_mongo_db),
+    max_evals: Optional[int] = Query(None, ge=10, le=5000),
+    batch_size: Optional[int] = Query(None, ge=1, le=512),
+    time_budget_ms: Optional[int] = Query(None, ge=100, le=120000, description="Lowers max_evals to fit the budget"),
+    top_k: Optional[int] = Query(None, ge=1, le=len(CLASS_LABELS), description="Explain the k most probable classes in one run"),
+    accept: Optional[str] = Header(None),
+    db: AsyncDatabase = Depends(get_async_db),
     user: Optional[dict] = Depends(get_current_user_optional)
 ):
-    result = await explain_image_with_shap(file)
+    image_data = await file.read()
+    model_version = await resolve_model_version(db, user, history_id, image_data)
+    result = await run_explanation(
+        "shap", image_data, model_version,
+        max_evals=max_evals, batch_size=batch_size, time_budget_ms=time_budget_ms, top_k=top_k
+    )
 
     if result is None:
         raise invalid_image_exception
     
-    overlay_bgr = cv2.cvtColor(result["overlay"], cv2.COLOR_RGB2BGR)
-    heatmap_bgr = cv2.cvtColor(result["heatmap"], cv2.COLOR_RGB2BGR)
-
-    if user:
-        explanation_item = handle_authenticated_user(db, file, "shap", overlay_bgr, heatmap_bgr, history_id)
-    else:
-        explanation_item = handle_unknown_user("shap", overlay_bgr, heatmap_bgr)
-
-    explanation_response = Explanation(
-        history_id=history_id,
-        explanations=[explanation_item]
-    )
-    return XAIResponse(
-        predicted_class=result["predicted_class"],
-        predicted_probs=result["predicted_probs"],
-        explanations=asdict(explanation_response)
-    )
+    return await build_xai_response(db, user, "shap", result, file.filename, history_id, model_version, response_mode(accept))
     
 
 @xai_router.post("/ig", response_model=XAIResponse)
 async def integrated_gradients_explanation(
     file: UploadFile = File(...),
     history_id: Optional[str] = Form(None),
-    db: Database = Depends(get_mongo_db),
+    accept: Optional[str] = Header(None),
+    db: AsyncDatabase = Depends(get_async_db),
     user: Optional[dict] = Depends(get_current_user_optional)
 ):
-    result = await explain_image_with_integrated_gradients(file)
+    image_data = await file.read()
+    model_version = await resolve_model_version(db, user, history_id, image_data)
+    result = await run_explanation("ig", image_data, model_version)
 
     if result is None:
         raise invalid_image_exception
     
-    overlay_bgr = cv2.cvtColor(result["overlay"], cv2.COLOR_RGB2BGR)
-    heatmap_bgr = cv2.cvtColor(result["heatmap"], cv2.COLOR_RGB2BGR)
+    return await build_xai_response(db, user, "integrated gradients", result, file.filename, history_id, model_version, response_mode(accept))
 
-    if user:
-        explanation_item = handle_authenticated_user(db, file, "integrated gradients", overlay_bgr, heatmap_bgr, history_id)
-    else:
-        explanation_item = handle_unknown_user("integrated gradients", overlay_bgr, heatmap_bgr)
 
-    explanation_response = Explanation(
-        history_id=history_id,
-        explanations=[explanation_item]
-    )
-    return XAIResponse(
-        predicted_class=result["predicted_class"],
-        predicted_probs=result["predicted_probs"],
-        explanations=asdict(explanation_response)
+@xai_router.post("/explain", response_model=XAIResponse)
+async def multi_explanation(
+    methods: str = Query(..., description="Comma-separated list, e.g. gradcam,lime,ig"),
+    file: UploadFile = File(...),
+    history_id: Optional[str] = Form(None),
+    accept: Optional[str] = Header(None),
+    db: AsyncDatabase = Depends(get_async_db),
+    user: Optional[dict] = Depends(get_current_user_optional)
+):
+    method_keys = parse_methods(methods)
+    image_data = await file.read()
+    model_version = await resolve_model_version(db, user, history_id, image_data)
+    results, errors = await run_explanations(method_keys, image_data, model_version)
+
+    if not results:
+        raise invalid_image_exception
+
+    return await build_multi_xai_response(
+        db, user, results, file.filename, history_id, model_version, response_mode(accept), errors
     )
 
 
 @xai_router.get("/images/{image_id}")
-async def get_image(image_id: str, db: Database = Depends(get_mongo_db)):
+async def get_image(
+    image_id: str,
+    if_none_match: Optional[str] = Header(None),
+    range: Optional[str] = Header(None),
+    db: AsyncDatabase = Depends(get_async_db)
+):
     try:
         object_id = ObjectId(image_id)
     except Exception:
         raise invalid_image_id_exception
     
     try:
-        return get_image_from_gridfs(db, image_id)
+        return await get_image_from_gridfs(db, image_id, if_none_match=if_none_match, range_header=range)
+    except HTTPException:
+        raise
     except Exception:
         raise image_not_found_exception
     
 
+@xai_router.get("/blobs/{blob_id}")
+async def get_blob_endpoint(blob_id: str):
+    blob = get_blob(blob_id)
+    if blob is None:
+        raise blob_not_found_exception
+
+    return Response(
+        content=blob["data"],
+        media_type=blob["content_type"],
+        headers={"Cache-Control": f"private, max-age={XAI_BLOB_TTL_SECONDS}"}
+    )
+
+
 @xai_router.get("/images/all_images")
-async def list_all_images(db: Database = Depends(get_mongo_db)):
-    fs = GridFS(db)
-    files = fs.find()
+async def list_all_images(db: AsyncDatabase = Depends(get_async_db)):
+    files = await ImageRepository(db).list_files()
     result = []
 
     for file in files:
         result.append({
-            "filename": file.filename,
-            "file_id": str(file._id),
-            "upload_date": file.upload_date.isoformat() 
+            "filename": file["filename"],
+            "file_id": str(file["_id"]),
+            "upload_date": file["uploadDate"].isoformat() 
         })
 
     return JSONResponse(content=result)
 
 
 @xai_router.delete("/images/delete_all_images")
-async def delete_all_images_endpoint(db: Database = Depends(get_mongo_db)):
+async def delete_all_images_endpoint(db: AsyncDatabase = Depends(get_async_db)):
     try:
-        delete_all_images(db)
+        await delete_all_images(db)
         return JSONResponse(content={"message": "All images have been deleted successfully."})
     except Exception as e:
         return JSONResponse(content={"message": str(e)}, status_code=400)
\ No newline at end of file
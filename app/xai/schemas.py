@@ -5,4 +5,6 @@ from bson import ObjectId
 class XAIResponse(BaseModel):
     predicted_class: str
     predicted_probs: List[float]
-    explanations: dict
\ No newline at end of file
+    explanations: dict
+    metrics: Optional[dict] = None  # e.g. Anchor precision / coverage
+    errors: Optional[dict] = None  # /explain: method -> why it has no explanation
\ No newline at end of file
@@ -1,106 +1,198 @@
-from fastapi import UploadFile
+import asyncio
+from bson import ObjectId
+from bson.errors import InvalidId
+import cv2
 import numpy as np
-import matplotlib.cm as cm
-from app.classification_models.model_loader import model
+from app.classification_models.model_loader import choose_model, get_model, preprocess_input, registry
 from app.constants import CLASS_LABELS
 from app.utils.preprocess_image import load_and_preprocess_image
-from tensorflow.keras.applications.efficientnet import preprocess_input
-from app.utils.saving_images import encode_image_to_base64, save_image_to_gridfs
-from app.xai.models import ExplanationItem
-from app.xai.methods.gradcam import generate_gradcam_for_image
-from app.xai.methods.lime import generate_lime_for_image, get_lime_heatmap, get_lime_overlay
-from app.xai.methods.anchor import generate_anchor_for_image
-from app.xai.methods.shap import generate_shap_for_image, get_shap_heatmap
-from app.xai.methods.integrated_gradients import IntegratedGradVisualizer, generate_integrated_gradients_for_image
+from app.db.repositories import ExplanationRepository, HistoryRepository, ImageRepository
+from app.utils.saving_images import (
+    artifact_content_type,
+    encode_attribution_map,
+    encode_image,
+    save_attribution_map_to_gridfs,
+    save_image_to_gridfs
+)
+from app.utils.result_cache import make_cache_key, result_cache
+from app.utils.workers import run_in_worker
+from app.xai.config import SHAP_MAX_EVALS
+from app.xai.delivery import Attachments, attachments_for, base64_reference
+from app.xai.models import Explanation, ExplanationItem, PreparedImage
+from app.xai.rendering import blend, colorize, colorize_labels
+from app.xai.schemas import XAIResponse
 from app.utils.exceptions import (
+    ExplanationBudgetExceeded,
+    explanation_budget_exceeded_exception,
     user_history_not_found_exception,
-    invalid_image_id_exception
+    invalid_image_id_exception,
+    invalid_image_exception,
+    unsupported_xai_method_exception
 )
-from bson import ObjectId
 from dataclasses import asdict
-from skimage.color import label2rgb
+from fastapi import HTTPException
+from typing import List, Tuple
+from starlette.concurrency import run_in_threadpool
 
 
-def delete_old_explanation_image(db, old_image_id):
+async def delete_old_explanation_image(db, old_image_id):
     try:
-        db.fs.files.delete_one({"_id": ObjectId(old_image_id)})
-        db.fs.chunks.delete_many({"files_id": ObjectId(old_image_id)})
+        await ImageRepository(db).delete(old_image_id)
     except Exception:
         raise invalid_image_id_exception
 
 
-def handle_authenticated_user(
-    db, file, method_name: str, overlay_bgr, heatmap_bgr, history_id
+# GridFS files referenced by one explanation item
+EXPLANATION_FILE_KEYS = ("overlay_image_id", "heatmap_image_id", "attribution_map_id")
+
+
+async def save_explanation_item(
+    db, filename: str, method_name: str, overlay_bgr, heatmap_bgr, attribution, history_id, model_version=None,
+    target_class=None
 ) -> ExplanationItem:
-    if not history_id:
-        raise user_history_not_found_exception
+    name = f"{method_name}_{target_class}" if target_class else method_name
+    image_id_overlay = await save_image_to_gridfs(db, overlay_bgr, f"{name}_overlay_{filename}_{history_id}")
+    image_id_heatmap = await save_image_to_gridfs(db, heatmap_bgr, f"{name}_heatmap_{filename}_{history_id}")
+    map_id, map_content_type, value_range = await save_attribution_map_to_gridfs(
+        db, attribution, f"{name}_attribution_{filename}_{history_id}"
+    )
 
-    filename_overlay = f"{method_name}_overlay_{file.filename}_{history_id}"
-    image_id_overlay = save_image_to_gridfs(db, overlay_bgr, filename_overlay)
-    
-    filename_heatmap = f"{method_name}_heatmap_{file.filename}_{history_id}"
-    image_id_heatmap = save_image_to_gridfs(db, heatmap_bgr, filename_heatmap)
-    
-    explanation_item = ExplanationItem(
+    return ExplanationItem(
         method=method_name,
         overlay_image_id=str(image_id_overlay),
-        heatmap_image_id=str(image_id_heatmap)
+        heatmap_image_id=str(image_id_heatmap),
+        model_version=model_version,
+        image_content_type=artifact_content_type(),
+        attribution_map_id=str(map_id) if map_id else None,
+        attribution_map_content_type=map_content_type,
+        attribution_range=value_range,
+        target_class=target_class
     )
 
-    existing = db.explanations.find_one({
-        "history_id": ObjectId(history_id),
-        "explanations.method": method_name
-    })
-
-    if existing:
-        item = next((e for e in existing["explanations"] if e["method"] == method_name), None)
-        if item:
-            old_image_id_overlay = item.get("overlay_image_id")
-            if old_image_id_overlay:
-                delete_old_explanation_image(db, old_image_id_overlay)
-
-            old_image_id_heatmap = item.get("heatmap_image_id")
-            if old_image_id_heatmap:
-                delete_old_explanation_image(db, old_image_id_heatmap)
-
-
-        db.explanations.update_one(
-            {"history_id": ObjectId(history_id)},
-            {"$set": {
-                    "explanations.$[elem].overlay_image_id": image_id_overlay,
-                    "explanations.$[elem].heatmap_image_id": image_id_heatmap
-                }
-            },
-            array_filters=[{"elem.method": method_name}]
-        )
-    else:
-        db.explanations.update_one(
-            {"history_id": ObjectId(history_id)},
-            {"$push": {"explanations": asdict(explanation_item)}},
-            upsert=True
-        )
 
-    return explanation_item
+async def handle_authenticated_user_many(db, filename: str, images: list, history_id, model_version=None) -> List[ExplanationItem]:
+    # images: (method_name, overlay_bgr, heatmap_bgr, attribution, target_class) for every item of one
+    # request; all earlier items of those methods are replaced, extra SHAP classes included
+    if not history_id:
+        raise user_history_not_found_exception
+
+    explanation_items = []
+    for method_name, overlay_bgr, heatmap_bgr, attribution, target_class in images:
+        explanation_items.append(await save_explanation_item(
+            db, filename, method_name, overlay_bgr, heatmap_bgr, attribution, history_id, model_version, target_class
+        ))
+
+    new_methods = {item.method for item in explanation_items}
+    explanations = ExplanationRepository(db)
+    existing = await explanations.get_by_history_id(history_id) or {}
+
+    kept = []
+    for item in existing.get("explanations", []):
+        if item["method"] not in new_methods:
+            kept.append(item)
+            continue
+        for key in EXPLANATION_FILE_KEYS:
+            if item.get(key):
+                await delete_old_explanation_image(db, item[key])
+
+    await explanations.set_explanations(history_id, kept + [asdict(item) for item in explanation_items])
+    return explanation_items
+
+
+def handle_unknown_user(
+    method_name: str, overlay_bgr, heatmap_bgr, model_version=None, attribution=None, attachments: Attachments = None,
+    target_class=None
+) -> ExplanationItem:
+    # base64 inside the JSON by default; binary response modes reference raw bytes instead
+    reference = attachments.add if attachments is not None else base64_reference
+    name = (f"{method_name}-{target_class}" if target_class else method_name).replace(" ", "-")
+
+    overlay_data, image_content_type = encode_image(overlay_bgr)
+    heatmap_data, _ = encode_image(heatmap_bgr)
+    overlay_reference = reference(f"{name}-overlay", overlay_data, image_content_type)
+    heatmap_reference = reference(f"{name}-heatmap", heatmap_data, image_content_type)
 
+    map_reference = map_content_type = value_range = None
+    encoded_map = encode_attribution_map(attribution)
+    if encoded_map is not None:
+        map_data, map_content_type, value_range = encoded_map
+        map_reference = reference(f"{name}-attribution", map_data, map_content_type)
 
-def handle_unknown_user(method_name: str, overlay_bgr, heatmap_bgr) -> ExplanationItem:
-    overlay_base64 = encode_image_to_base64(overlay_bgr)
-    heatmap_base64 = encode_image_to_base64(heatmap_bgr)
     return ExplanationItem(
         method=method_name,
-        overlay_image_id=overlay_base64,
-        heatmap_image_id=heatmap_base64
+        overlay_image_id=overlay_reference,
+        heatmap_image_id=heatmap_reference,
+        model_version=model_version,
+        image_content_type=image_content_type,
+        attribution_map_id=map_reference,
+        attribution_map_content_type=map_content_type,
+        attribution_range=value_range,
+        target_class=target_class
+    )
+
+
+def explanation_images(method_name: str, result: dict) -> list:
+    # (method_name, overlay_bgr, heatmap_bgr, attribution, target_class): the main item, then one
+    # per extra class explained by the same run (SHAP top_k)
+    images = [(
+        method_name, cv2.cvtColor(result["overlay"], cv2.COLOR_RGB2BGR),
+        cv2.cvtColor(result["heatmap"], cv2.COLOR_RGB2BGR), result.get("attribution"), None
+    )]
+    if "class_heatmaps" in result:
+        extras = zip(
+            result["metrics"]["classes"][1:], result["class_overlays"], result["class_heatmaps"], result["class_attributions"]
+        )
+        for target_class, overlay, heatmap, attribution in extras:
+            images.append((
+                method_name, cv2.cvtColor(overlay, cv2.COLOR_RGB2BGR),
+                cv2.cvtColor(heatmap, cv2.COLOR_RGB2BGR), attribution, target_class
+            ))
+    return images
+
+
+async def build_xai_response(db, user, method_name: str, result: dict, filename: str, history_id, model_version=None, mode: str = "json"):
+    attachments = attachments_for(user, mode)
+    images = explanation_images(method_name, result)
+
+    if user:
+        explanation_items = await handle_authenticated_user_many(db, filename, images, history_id, model_version)
+    else:
+        explanation_items = [
+            handle_unknown_user(name, overlay_bgr, heatmap_bgr, model_version, attribution, attachments, target_class)
+            for name, overlay_bgr, heatmap_bgr, attribution, target_class in images
+        ]
+
+    explanation_response = Explanation(
+        history_id=history_id,
+        explanations=explanation_items
     )
+    response = XAIResponse(
+        predicted_class=result["predicted_class"],
+        predicted_probs=result["predicted_probs"],
+        explanations=asdict(explanation_response),
+        metrics=result.get("metrics")
+    )
+    return attachments.response(response) if attachments else response
+
+
+def prepare_image(image_data: bytes, model_version: str) -> PreparedImage:
+    # Decode, clean and predict once; every method works from the same result
+    model_entry = registry.entry(model_version)
+    original_image = load_and_preprocess_image(image_data)
+    image_np = preprocess_input(original_image)
+    preds = model_entry.predictor.predict(np.expand_dims(image_np, axis=0))
+    return PreparedImage(original=original_image, image=image_np, preds=preds, model_version=model_entry.version)
+
 
+# The explainer libraries (lime, shap, alibi, skimage) are imported on the
+# first request for their method, which keeps process startup fast.
+
+def explain_image_with_gradcam(prepared: PreparedImage):
+    from app.xai.methods.gradcam import generate_gradcam_for_image
 
-async def explain_image_with_gradcam(file: UploadFile):
-    # Зчитування і підготовка зображення
-    image_data = await file.read()
-    image_np = load_and_preprocess_image(image_data)
-    image_np = preprocess_input(image_np)
     # Отримання GradCAM
-    pred_class, heatmap, overlay, masked_output, probs = generate_gradcam_for_image(
-        image_np, model, layer_name="conv5_block3_3_conv"
+    pred_class, heatmap, overlay, masked_output, probs, cam = generate_gradcam_for_image(
+        prepared.image, get_model(prepared.model_version), layer_name="conv5_block3_3_conv", preds=prepared.preds
     )
 
     return {
@@ -108,26 +200,24 @@ async def explain_image_with_gradcam(file: UploadFile):
         "predicted_probs": probs[0].tolist(),
         "heatmap": heatmap,
         "overlay": overlay,
+        "attribution": (cam / 255.0).astype(np.float16),
         # "masked_output": masked_output,
     }
 
 
-async def explain_image_with_lime(file: UploadFile):
-    image_data = await file.read()
-    image_np = load_and_preprocess_image(image_data)
-    image_np = preprocess_input(image_np)
+def explain_image_with_lime(prepared: PreparedImage):
+    from app.xai.methods.lime import generate_lime_for_image, get_lime_heatmap, get_lime_overlay
 
+    # forward passes only, so LIME runs on the serving backend (keras, tflite or onnx)
     predicted_class_idx, explanation, probs = generate_lime_for_image(
-        image_np, model
+        prepared.image, registry.entry(prepared.model_version).get_backend(), preds=prepared.preds
     )
     
     if explanation is None:
         return None
     
     heatmap_norm = get_lime_heatmap(explanation, predicted_class_idx)
-    colormap = cm.get_cmap('Spectral')
-    heatmap_rgb = colormap(heatmap_norm)[..., :3]
-    heatmap_rgb_uint8 = (heatmap_rgb * 255).astype(np.uint8)
+    heatmap_rgb_uint8 = colorize(heatmap_norm)
 
     overlay = get_lime_overlay(explanation, predicted_class_idx)
 
@@ -135,75 +225,80 @@ async def explain_image_with_lime(file: UploadFile):
         "predicted_class": CLASS_LABELS[int(predicted_class_idx)],
         "predicted_probs": probs[0].tolist(),
         "heatmap": heatmap_rgb_uint8,
-        "overlay": overlay
+        "overlay": overlay,
+        "attribution": heatmap_norm.astype(np.float16)
     }
 
 
-async def explain_image_with_anchor(file: UploadFile):
-    image_data = await file.read()
-    image_np = load_and_preprocess_image(image_data)
-    image_np = preprocess_input(image_np)
+def explain_image_with_anchor(prepared: PreparedImage, time_budget_ms=None, max_samples=None):
+    from app.xai.methods.anchor import generate_anchor_for_image
 
-    explanation, predicted_class_idx, probs = generate_anchor_for_image(
-        image_np, model
+    # forward passes only, so Anchor runs on the serving backend (keras, tflite or onnx)
+    explanation, predicted_class_idx, probs, metrics = generate_anchor_for_image(
+        prepared.image, registry.entry(prepared.model_version).get_backend(), preds=prepared.preds,
+        time_budget_ms=time_budget_ms, max_samples=max_samples
     )
     
     if explanation is None:
         return None
     
     overlay = explanation.anchor.astype(np.uint8)
-    heatmap = explanation.segments
-    
-    num_labels = int(heatmap.max()) + 1
-
-    colormap = cm.get_cmap('Spectral', num_labels)
-    colors = [colormap(i)[:3] for i in range(num_labels)]  
-    
-    heatmap_rgb = label2rgb(heatmap, colors=colors, bg_label=0)
-    heatmap_rgb = (heatmap_rgb * 255).astype(np.uint8)
+    heatmap_rgb = colorize_labels(explanation.segments)
 
     return {
         "predicted_class": CLASS_LABELS[int(predicted_class_idx)],
         "predicted_probs": probs[0].tolist(),
         "heatmap": heatmap_rgb,
-        "overlay": overlay
+        "overlay": overlay,
+        # 1 on the superpixels of the anchor
+        "attribution": np.isin(explanation.segments, explanation.raw["feature"]).astype(np.float16),
+        "metrics": metrics
     }
 
 
-async def explain_image_with_shap(file: UploadFile):
-    image_data = await file.read()
-    image_np = load_and_preprocess_image(image_data)
-    image_np = preprocess_input(image_np)
+def explain_image_with_shap(prepared: PreparedImage, max_evals=None, batch_size=None, time_budget_ms=None, top_k=None):
+    from app.xai.methods.shap import generate_shap_for_image, get_shap_heatmap
 
-    explanation, predicted_class_idx, probs = generate_shap_for_image(
-        image_np, model, top_k=1
+    # forward passes only, so SHAP runs on the serving backend (keras, tflite or onnx)
+    explanation, predicted_class_idx, probs, metrics = generate_shap_for_image(
+        prepared.image, registry.entry(prepared.model_version).get_backend(), preds=prepared.preds,
+        max_evals=max_evals, batch_size=batch_size, time_budget_ms=time_budget_ms, top_k=top_k or 1
     )
     
     if explanation is None:
         return None
     
-    overlay = image_np
     heatmap = get_shap_heatmap(explanation)
 
-    colormap = cm.get_cmap('Spectral')
-    shap_rgb = colormap(heatmap)[..., :3]
-    shap_rgb_uint8 = (shap_rgb * 255).astype(np.uint8)
+    shap_rgb_uint8 = colorize(heatmap)
+    overlay = blend(prepared.image, shap_rgb_uint8)
 
-    return {
+    result = {
         "predicted_class": CLASS_LABELS[int(predicted_class_idx)],
         "predicted_probs": probs[0].tolist(),
         "heatmap": shap_rgb_uint8,
-        "overlay": overlay
+        "overlay": overlay,
+        "attribution": heatmap.astype(np.float16),
+        "metrics": metrics
     }
 
+    # the other top_k classes come out of the same run; stacked arrays so the result cache stores them as-is
+    if len(metrics["classes"]) > 1:
+        class_maps = [get_shap_heatmap(explanation, rank) for rank in range(1, len(metrics["classes"]))]
+        result["class_heatmaps"] = np.stack([colorize(class_map) for class_map in class_maps])
+        result["class_overlays"] = np.stack([blend(prepared.image, heatmap) for heatmap in result["class_heatmaps"]])
+        result["class_attributions"] = np.stack(class_maps).astype(np.float16)
+    return result
 
-async def explain_image_with_integrated_gradients(file: UploadFile):
-    image_data = await file.read()
-    original_image = load_and_preprocess_image(image_data)  
+
+def explain_image_with_integrated_gradients(prepared: PreparedImage):
+    from app.xai.methods.integrated_gradients import IntegratedGradVisualizer, generate_integrated_gradients_for_image
+
+    original_image = prepared.original
     
     image_np = preprocess_input(original_image.astype(np.float32)) 
 
-    grads, igrads, predicted_class_idx, probs = generate_integrated_gradients_for_image(image_np, model)
+    grads, igrads, predicted_class_idx, probs = generate_integrated_gradients_for_image(image_np, get_model(prepared.model_version), preds=prepared.preds)
 
     if grads is None or igrads is None:
         return None
@@ -219,10 +314,166 @@ async def explain_image_with_integrated_gradients(file: UploadFile):
 
     overlay = igrads_attr_outlines.astype(np.uint8)
     heatmap = igrads_attr.astype(np.uint8)
+    # positive attributions scaled to [0, 1]; raw IG values are too small for float16
+    attribution, _ = vis.prepare_attributions(igrads.numpy())
+    attribution = attribution / max(float(attribution.max()), 1e-12)
 
     return {
         "predicted_class": CLASS_LABELS[int(predicted_class_idx)],
         "predicted_probs": probs[0].tolist(),
         "heatmap": heatmap,
-        "overlay": overlay
+        "overlay": overlay,
+        "attribution": attribution.astype(np.float16)
+    }
+
+
+async def build_multi_xai_response(
+    db, user, results: dict, filename: str, history_id, model_version=None, mode: str = "json", errors: dict = None
+):
+    attachments = attachments_for(user, mode)
+    images = [
+        image
+        for method, result in results.items()
+        for image in explanation_images(XAI_METHODS[method][0], result)
+    ]
+
+    if user:
+        explanation_items = await handle_authenticated_user_many(db, filename, images, history_id, model_version)
+    else:
+        explanation_items = [
+            handle_unknown_user(method_name, overlay_bgr, heatmap_bgr, model_version, attribution, attachments, target_class)
+            for method_name, overlay_bgr, heatmap_bgr, attribution, target_class in images
+        ]
+
+    first = next(iter(results.values()))
+    explanation_response = Explanation(
+        history_id=history_id,
+        explanations=explanation_items
+    )
+    metrics = {method: result["metrics"] for method, result in results.items() if result.get("metrics")}
+    response = XAIResponse(
+        predicted_class=first["predicted_class"],
+        predicted_probs=first["predicted_probs"],
+        explanations=asdict(explanation_response),
+        metrics=metrics or None,
+        errors=errors or None
+    )
+    return attachments.response(response) if attachments else response
+
+
+# key -> (name stored in db.explanations, explain function)
+XAI_METHODS = {
+    "gradcam": ("gradcam", explain_image_with_gradcam),
+    "lime": ("lime", explain_image_with_lime),
+    "anchor": ("anchor", explain_image_with_anchor),
+    "shap": ("shap", explain_image_with_shap),
+    "ig": ("integrated gradients", explain_image_with_integrated_gradients),
+}
+
+
+def explain_image(method: str, image_data: bytes, model_version: str, **options):
+    _, explain_fn = XAI_METHODS[method]
+    return explain_fn(prepare_image(image_data, model_version), **options)
+
+
+async def resolve_model_version(db, user, history_id, image_data: bytes) -> str:
+    # explanations of a saved classification use the model that produced it, if it is still served
+    if user and history_id:
+        try:
+            history = await HistoryRepository(db).get_for_user(ObjectId(history_id), user["_id"])
+        except InvalidId:
+            history = None
+        model_version = history.get("model_version") if history else None
+        if model_version and registry.has(model_version):
+            return model_version
+    return choose_model(user, image_data).version
+
+
+async def run_explanation(method: str, image_data: bytes, model_version: str, **options):
+    # options: per-request tuning of the method (e.g. SHAP max_evals), part of the cache key
+    options = {key: value for key, value in options.items() if value is not None}
+    cache_key = make_cache_key(image_data, method, model_version=model_version, **cache_options(method, options))
+    result = await run_in_threadpool(result_cache.get, cache_key)
+    if result is not None:
+        return result
+
+    try:
+        result = await run_in_worker(method, explain_image, method, image_data, model_version, **options)
+    except ExplanationBudgetExceeded:
+        raise explanation_budget_exceeded_exception
+    if is_cacheable(result):
+        used_options = cache_options(method, options, result)
+        cache_key = make_cache_key(image_data, method, model_version=model_version, **used_options)
+        await run_in_threadpool(result_cache.set, cache_key, result)
+    return result
+
+
+def cache_options(method: str, options: dict, result: dict = None) -> dict:
+    # The SHAP time budget only picks max_evals from a load-dependent estimate, so results
+    # are cached under the max_evals actually used. A lookup uses the requested max_evals:
+    # a cached full-quality result is always good enough for a budgeted request.
+    if method != "shap" or "time_budget_ms" not in options:
+        return options
+    key_options = {key: value for key, value in options.items() if key != "time_budget_ms"}
+    used_evals = result["metrics"]["max_evals"] if result is not None else None
+    if used_evals is not None and used_evals != options.get("max_evals", SHAP_MAX_EVALS):
+        key_options["max_evals"] = used_evals
+    return key_options
+
+
+def is_cacheable(result) -> bool:
+    # a search cut short by its budget depends on the load at the time, so it is not kept
+    return result is not None and not (result.get("metrics") or {}).get("budget_exhausted")
+
+
+def parse_methods(methods: str) -> List[str]:
+    parsed = list(dict.fromkeys(m.strip() for m in methods.split(",") if m.strip()))
+    if not parsed or any(m not in XAI_METHODS for m in parsed):
+        raise unsupported_xai_method_exception
+    return parsed
+
+
+def error_detail(error: Exception) -> str:
+    # what a client may see about one failed method of a multi-method request
+    if isinstance(error, ExplanationBudgetExceeded):
+        return explanation_budget_exceeded_exception.detail
+    if isinstance(error, HTTPException):
+        return error.detail
+    return invalid_image_exception.detail
+
+
+async def run_explanations(methods: List[str], image_data: bytes, model_version: str) -> Tuple[dict, dict]:
+    # -> (results, errors): method -> result for those that produced one, method -> detail for the rest
+    cache_keys = {method: make_cache_key(image_data, method, model_version=model_version) for method in methods}
+    results = await run_in_threadpool(lambda: {m: result_cache.get(key) for m, key in cache_keys.items()})
+
+    missing = [method for method, result in results.items() if result is None]
+    failures = {}
+    if missing:
+        prepared = await run_in_worker("classify", prepare_image, image_data, model_version)
+        # one method failing or hitting its limiter must not throw away the others
+        computed = await asyncio.gather(*[
+            run_in_worker(method, XAI_METHODS[method][1], prepared) for method in missing
+        ], return_exceptions=True)
+        for method, result in zip(missing, computed):
+            if isinstance(result, BaseException):
+                # cancellation and interpreter exits are not a method failing
+                if not isinstance(result, Exception):
+                    raise result
+                failures[method] = result
+                result = None
+            results[method] = result
+            if is_cacheable(result):
+                await run_in_threadpool(result_cache.set, cache_keys[method], result)
+
+        if failures and all(result is None for result in results.values()):
+            error = next(iter(failures.values()))
+            if isinstance(error, ExplanationBudgetExceeded):
+                raise explanation_budget_exceeded_exception
+            raise error
+
+    errors = {
+        method: error_detail(failures[method]) if method in failures else invalid_image_exception.detail
+        for method, result in results.items() if result is None
     }
+    return {method: result for method, result in results.items() if result is not None}, errors
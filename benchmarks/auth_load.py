@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import io
+import time
+
+import numpy as np
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+
+from app.auth.hashing import bcrypt_context, verify_password, verify_password_async
+from app.utils.preprocess_image import clean_skin_image, decode_image
+from app.utils.workers import run_in_worker, shutdown_executor
+
+
+# Usage:
+#   python -m benchmarks.auth_load --duration 10 --classify-concurrency 4 --login-concurrency 16
+# Runs classification preprocessing (decode + hair removal on the worker pool) under a
+# burst of logins and reports both sides, once with bcrypt on the dedicated hashing pool
+# and once on the shared threadpool it used before. No server, Mongo or model needed.
+
+def synthetic_photos(count: int, size=(1024, 768)):
+    rng = np.random.default_rng(0)
+    photos = []
+    for _ in range(count):
+        pixels = rng.integers(0, 255, size=(size[1], size[0], 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+def classify_work(image_bytes: bytes):
+    return clean_skin_image(decode_image(image_bytes))
+
+
+async def classify_loop(photos, deadline, latencies):
+    i = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await run_in_worker("classify", classify_work, photos[i % len(photos)])
+        latencies.append(time.perf_counter() - started)
+        i += 1
+
+
+async def login_loop(verify, hashed, deadline, counter):
+    while time.perf_counter() < deadline:
+        await verify("benchmark-password", hashed)
+        counter[0] += 1
+
+
+async def shared_threadpool_verify(plain_password, hashed_password):
+    return await run_in_threadpool(verify_password, plain_password, hashed_password)
+
+
+async def run_phase(name, photos, hashed, verify, args):
+    deadline = time.perf_counter() + args.duration
+    latencies, logins = [], [0]
+    tasks = [classify_loop(photos, deadline, latencies) for _ in range(args.classify_concurrency)]
+    if verify is not None:
+        tasks += [login_loop(verify, hashed, deadline, logins) for _ in range(args.login_concurrency)]
+    await asyncio.gather(*tasks)
+
+    latencies_ms = np.array(latencies) * 1000.0
+    print(
+        f"  {name:<28} classify {len(latencies) / args.duration:7.1f}/s"
+        f"  p50 {np.percentile(latencies_ms, 50):7.1f} ms  p95 {np.percentile(latencies_ms, 95):7.1f} ms"
+        f"  logins {logins[0] / args.duration:6.1f}/s"
+    )
+
+
+async def main_async(args):
+    photos = synthetic_photos(16)
+    hashed = bcrypt_context.copy(bcrypt__rounds=args.rounds).hash("benchmark-password")
+
+    print(f"bcrypt rounds {args.rounds}, {args.duration}s per phase, "
+          f"{args.classify_concurrency} classify / {args.login_concurrency} login clients")
+    await run_phase("classify only", photos, hashed, None, args)
+    await run_phase("+ logins, hashing pool", photos, hashed, verify_password_async, args)
+    await run_phase("+ logins, shared threadpool", photos, hashed, shared_threadpool_verify, args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Login throughput against concurrent classify load")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--classify-concurrency", type=int, default=4)
+    parser.add_argument("--login-concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        shutdown_executor()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,50 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.auth.routes import auth, user
 from app.classification.routes import classify_router
 from app.xai.routes import xai_router
+from app.jobs.routes import jobs_router
+from app.health.routes import health_router
+from app.classification_models.config import MODEL_LOAD_MODE, MODEL_RELOAD_INTERVAL_SECONDS
+from app.classification_models.model_loader import registry
+from app.jobs.config import JOBS_WORKER_MODE
+from app.jobs.worker import JobWorker
+from app.db.mongo import close_async_client, get_async_db
+from app.db.indexes import ensure_indexes
+from app.utils.workers import shutdown_executor
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import origins
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the server starts accepting requests right away, /health/ready reports when the model is in
+    if MODEL_LOAD_MODE == "eager":
+        registry.load_in_background()
+    registry.start_watcher(MODEL_RELOAD_INTERVAL_SECONDS)
+
+    db = await get_async_db()
+    await ensure_indexes(db)
+
+    job_worker = None
+    if JOBS_WORKER_MODE == "local":
+        job_worker = JobWorker(db)
+        await job_worker.start()
+
+    yield
+
+    if job_worker:
+        await job_worker.stop()
+    registry.stop_watcher()
+    shutdown_executor()
+    await close_async_client()
+
+
 app = FastAPI(
     title="Skin Disease Classifier with XAI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -17,12 +53,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(auth.auth_router, prefix="/api/auth", tags=["Auth"])
 app.include_router(user.user_router, prefix="/api/users", tags=["Users"])
 app.include_router(classify_router, prefix="/api/classify", tags=["Classification"])
 app.include_router(xai_router, prefix="/api/xai", tags=["XAI"])
+app.include_router(jobs_router, prefix="/api/xai/jobs", tags=["XAI Jobs"])
+app.include_router(health_router, prefix="/health", tags=["Health"])
 
 
 if __name__ == '__main__':